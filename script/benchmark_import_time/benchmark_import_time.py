@@ -0,0 +1,105 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+from src import REPO_DIRECTORY
+
+DEFAULT_MODULES = [
+    "src.utils.preprocessing",
+    "src.utils.training",
+    "src.utils.evaluation",
+    "src.utils.wandb_visualization",
+]
+# Modules which take seconds to import and should only be imported when used
+HEAVY_MODULES = ["sklearn", "nltk", "wandb", "plotly", "pandas", "torch"]
+DEFAULT_MAX_MILLISECONDS = 300
+# Run in a new interpreter so that nothing is already imported
+IMPORT_TIME_CODE = """
+import json, sys, time
+start_time = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start_time
+heavy_modules = [name for name in {heavy_modules} if name in sys.modules]
+print(json.dumps([import_time * 1000, heavy_modules]))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the time it takes to import the src.utils modules,"
+        + " each in a new python process, and list the heavy modules they import."
+    )
+    parser.add_argument(
+        "-m",
+        "--modules",
+        help=f"The modules to import (default: {' '.join(DEFAULT_MODULES)}).",
+        nargs="+",
+        default=DEFAULT_MODULES,
+    )
+    parser.add_argument(
+        "-n",
+        "--n_rounds",
+        help="The number of times each module is imported (default: 5).",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--max_ms",
+        help="Fail when the median import time of a module is above this number"
+        + f" of milliseconds (default: {DEFAULT_MAX_MILLISECONDS}).",
+        type=float,
+        default=DEFAULT_MAX_MILLISECONDS,
+    )
+    args = parser.parse_args()
+    assert (
+        args.n_rounds >= 1
+    ), f"The number of rounds should be at least 1, got {args.n_rounds}"
+    return args.modules, args.n_rounds, args.max_ms
+
+
+def get_import_time(module: str) -> Tuple[float, List[str]]:
+    """
+    Import time in milliseconds of the module in a new python process and
+    the heavy modules which were imported along with it.
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            IMPORT_TIME_CODE.format(module=module, heavy_modules=HEAVY_MODULES),
+        ],
+        cwd=REPO_DIRECTORY,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    import_time, heavy_modules = json.loads(output.splitlines()[-1])
+    return import_time, heavy_modules
+
+
+def main():
+    modules, n_rounds, max_milliseconds = parse_args()
+    too_slow_modules = []
+    for module in modules:
+        import_times = []
+        for _ in range(n_rounds):
+            import_time, heavy_modules = get_import_time(module)
+            import_times.append(import_time)
+        median_import_time = statistics.median(import_times)
+        print(
+            f"{module}: {median_import_time:.0f} ms"
+            + (f", imports {', '.join(heavy_modules)}" if heavy_modules else "")
+        )
+        if median_import_time > max_milliseconds:
+            too_slow_modules.append(module)
+    if len(too_slow_modules) > 0:
+        sys.exit(
+            f"Slower to import than {max_milliseconds:.0f} ms: {', '.join(too_slow_modules)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
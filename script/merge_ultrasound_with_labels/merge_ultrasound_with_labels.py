@@ -1,10 +1,10 @@
 from script.merge_ultrasound_with_labels.utils import (
     get_ultrasound_features,
     get_ultrasound_labels,
-    get_ultrasound_text_dict,
-    merge_ultrasound_dataset,
+    iter_ultrasound_texts,
+    merge_ultrasound_dataset_to_jsonl,
     parse_args,
-    write_merged_dataset_to_jsonl,
+    print_merge_report,
 )
 
 
@@ -23,18 +23,19 @@ def main():
         features_file_path,
         output_file_path,
     ) = parse_args()
-    # Get dictionary of ultrasound text with ids as their key
-    ultrasound_text_dict = get_ultrasound_text_dict(ultrasound_folder_input_path)
-    # Get the labels
+    # Get the labels, the only thing kept in memory with their ids
     ultrasound_labels_dict = get_ultrasound_labels(labels_file_path)
-    # Get the features
-    ultrasound_features_dict = get_ultrasound_features(features_file_path)
-    # Merge the text, labels and features as a list of dictionaries
-    merged_ultrasound_dataset_dicts = merge_ultrasound_dataset(
-        ultrasound_text_dict, ultrasound_labels_dict, ultrasound_features_dict
+    # Get the memory-mapped features, if any
+    feature_store = get_ultrasound_features(features_file_path)
+    # Merge each ultrasound text with its label and features as it is read
+    # and write it to a .jsonl file
+    merge_report = merge_ultrasound_dataset_to_jsonl(
+        iter_ultrasound_texts(ultrasound_folder_input_path),
+        ultrasound_labels_dict,
+        output_file_path,
+        feature_store,
     )
-    # Write the merged dataset to a .jsonl file
-    write_merged_dataset_to_jsonl(merged_ultrasound_dataset_dicts, output_file_path)
+    print_merge_report(merge_report)
 
 
 if __name__ == "__main__":
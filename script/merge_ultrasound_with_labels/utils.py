@@ -1,8 +1,10 @@
 import argparse
 import os
 from pathlib import Path
-from typing import List
-import jsonlines
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from script.prepare_ultrasound_reports.utils import SHARD_FILE_PATTERN
+from src.utils.features import FeatureStore, read_feature_store
+from src.utils.json import JsonlinesWriter, is_jsonlines_file_path, iter_jsonlines
 
 
 def parse_args():
@@ -13,24 +15,27 @@ def parse_args():
     parser.add_argument(
         "-u",
         "--ultrasound_folder_input_path",
-        help="The folder path that contains the ultrasound text files. They should have the format id.txt",
+        help="The folder path that contains the ultrasound text files. They should have the format id.txt"
+        + " or be .jsonl shards of {id, text} records.",
         required=True,
     )
     parser.add_argument(
         "-l",
         "--labels_file_path",
-        help="The path to the .jsonl file containing the labels for each text file.",
+        help="The path to the .jsonl file (possibly .gz/.zst compressed) containing the labels for each text file.",
         required=True,
     )
     parser.add_argument(
         "-f",
         "--features_file_path",
-        help="The path to the .jsonl file containing the features for each text file.",
+        help="The path to the .npy features file (with its .index.json file of ids)"
+        + " containing the features for each text file.",
     )
     parser.add_argument(
         "-o",
         "--output_file_path",
-        help="The path to the .jsonl file containing the merged text, features and labels.",
+        help="The path to the .jsonl file containing the merged text, features and labels"
+        + " (compressed when it ends with .gz or .zst).",
         required=True,
     )
     args = parser.parse_args()
@@ -44,14 +49,15 @@ def parse_args():
     assert (
         ultrasound_folder_input_path.exists() and ultrasound_folder_input_path.is_dir()
     ), "The ultrasound text file folder either does not exist or is not a folder directory."
-    assert (
-        labels_file_path.exists() and labels_file_path.suffix == ".jsonl"
-    ), f"The labels file either does not exist or is not a .jsonl file, {labels_file_path.suffix}"
-    # assert (features_file_path.exists() and features_file_path.suffix == ".jsonl"), (
-    #         ), f"The labels file either does not exist or is not a .jsonl file, {features_file_path.suffix}")
-    assert (
-        output_file_path.suffix == ".jsonl"
-    ), f"The output file should be a .jsonl file, {output_file_path.suffix}"
+    assert labels_file_path.exists() and is_jsonlines_file_path(
+        labels_file_path
+    ), f"The labels file either does not exist or is not a .jsonl(.gz/.zst) file, {labels_file_path}"
+    assert features_file_path == "" or (
+        features_file_path.exists() and features_file_path.suffix == ".npy"
+    ), f"The features file either does not exist or is not a .npy file, {features_file_path}"
+    assert is_jsonlines_file_path(
+        output_file_path
+    ), f"The output file should be a .jsonl(.gz/.zst) file, {output_file_path}"
     if not output_file_path.parent.exists():
         os.makedirs(output_file_path.parent)
 
@@ -69,32 +75,48 @@ def get_ultrasound_text_dict(ultrasound_folder_input_path: Path) -> dict[str, st
     :param ultrasound_folder_input_path: The path to the folder containing the ultrasound text files
     :return: A dictionary of ultrasound text with ids as their key
     """
-    ultrasound_text_dict = {}
-    for file_path in ultrasound_folder_input_path.glob("*.txt"):
-        id = file_path.stem
-        with open(file_path, "r") as f:
-            text = f.read()
-        ultrasound_text_dict[id] = text
+    ultrasound_text_dict = dict(iter_ultrasound_texts(ultrasound_folder_input_path))
     assert len(ultrasound_text_dict) > 0, "No ultrasound text files found."
     return ultrasound_text_dict
 
 
+def iter_ultrasound_texts(
+    ultrasound_folder_input_path: Path,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily yield the (id, text) of every ultrasound report, from the .jsonl shards
+    then from the .txt files (each in the order of their names), so that only
+    one text is in memory at a time.
+    """
+    for shard_file_path in sorted(
+        ultrasound_folder_input_path.glob(SHARD_FILE_PATTERN)
+    ):
+        for obj in iter_jsonlines(shard_file_path):
+            yield obj["id"], obj["text"]
+    for file_path in sorted(ultrasound_folder_input_path.glob("*.txt")):
+        with open(file_path, "r") as f:
+            yield file_path.stem, f.read()
+
+
 def get_ultrasound_labels(labels_file_path: Path) -> dict[str, int]:
     ultrasound_labels_dict = {}
-    with jsonlines.open(labels_file_path) as reader:
-        for obj in reader:
-            assert (
-                len(obj.items()) == 1
-            ), "The labels file should contain only one key-value pair per line."
-            [(id_, label)] = obj.items()
-            ultrasound_labels_dict[id_] = label
+    for obj in iter_jsonlines(labels_file_path):
+        assert (
+            len(obj.items()) == 1
+        ), "The labels file should contain only one key-value pair per line."
+        [(id_, label)] = obj.items()
+        ultrasound_labels_dict[id_] = label
     assert len(ultrasound_labels_dict) > 0, "No labels found."
     return ultrasound_labels_dict
 
 
-def get_ultrasound_features(features_file_path: Path) -> dict[int, list]:
-    # TODO: What will the features look like?
-    pass
+def get_ultrasound_features(features_file_path: Path) -> Optional[FeatureStore]:
+    """
+    The memory-mapped feature store, None when there is no features file.
+    """
+    if features_file_path == "":
+        return None
+    return read_feature_store(features_file_path)
 
 
 def merge_ultrasound_dataset(
@@ -125,6 +147,87 @@ def merge_ultrasound_dataset(
 def write_merged_dataset_to_jsonl(
     merged_ultrasound_dataset_dicts: List[dict], output_file_path: Path
 ) -> None:
-    with jsonlines.open(output_file_path, mode="w") as writer:
+    with JsonlinesWriter(output_file_path) as writer:
         for merged_ultrasound_dataset_dict in merged_ultrasound_dataset_dicts:
             writer.write(merged_ultrasound_dataset_dict)
+
+
+class MergeReport(NamedTuple):
+    n_merged: int
+    # Ids of the texts without a label and of the labels without a text
+    unlabeled_text_ids: List[str]
+    unmatched_label_ids: List[str]
+    # Ids of the texts which were left out because their id already had a text,
+    # e.g. a report written both as a .txt file and in a .jsonl shard
+    duplicate_text_ids: List[str]
+    # Ids of the merged reports which are not in the feature store
+    featureless_ids: List[str]
+
+
+def merge_ultrasound_dataset_to_jsonl(
+    ultrasound_texts: Iterable[Tuple[str, str]],
+    ultrasound_labels_dict: dict[str, int],
+    output_file_path: Path,
+    feature_store: Optional[FeatureStore] = None,
+) -> MergeReport:
+    """
+    Streaming equivalent of merge_ultrasound_dataset followed by
+    write_merged_dataset_to_jsonl: a hash join of the texts against the
+    id -> label index, where each merged record is written as soon as its
+    text is read. Only the label index and the ids are kept in memory.
+    With a feature store, each record gets the feature_row of its features
+    in the store (-1 when it has none) rather than the features themselves.
+    The ids which could not be matched are returned rather than failing, as
+    are the ids with several texts, of which only the first one is merged.
+    """
+    merged_ids = set()
+    unlabeled_text_ids = []
+    duplicate_text_ids = []
+    featureless_ids = []
+    with JsonlinesWriter(output_file_path) as writer:
+        for id_, text in ultrasound_texts:
+            if id_ not in ultrasound_labels_dict:
+                unlabeled_text_ids.append(id_)
+                continue
+            if id_ in merged_ids:
+                duplicate_text_ids.append(id_)
+                continue
+            merged_ids.add(id_)
+            merged_record = {
+                "id": id_,
+                "text": text,
+                "label": ultrasound_labels_dict[id_],
+            }
+            if feature_store is not None:
+                merged_record["feature_row"] = feature_store.id_to_row.get(id_, -1)
+                if merged_record["feature_row"] == -1:
+                    featureless_ids.append(id_)
+            writer.write(merged_record)
+    unmatched_label_ids = [
+        id_ for id_ in ultrasound_labels_dict if id_ not in merged_ids
+    ]
+    return MergeReport(
+        len(merged_ids),
+        unlabeled_text_ids,
+        unmatched_label_ids,
+        duplicate_text_ids,
+        featureless_ids,
+    )
+
+
+def print_merge_report(merge_report: MergeReport, max_ids: int = 10) -> None:
+    print(f"{merge_report.n_merged} ultrasound reports merged with their label.")
+    for ids, description in [
+        (merge_report.unlabeled_text_ids, "ultrasound texts without a label"),
+        (merge_report.unmatched_label_ids, "labels without an ultrasound text"),
+        (
+            merge_report.duplicate_text_ids,
+            "ultrasound texts left out, their id already had a text",
+        ),
+        (merge_report.featureless_ids, "ultrasound reports without features"),
+    ]:
+        if len(ids) > 0:
+            print(
+                f"{len(ids)} {description}: {', '.join(ids[:max_ids])}"
+                + (", ..." if len(ids) > max_ids else "")
+            )
@@ -0,0 +1,138 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from script.pdf_txt.utils import (
+    PdfTextLayerExtractor,
+    get_layout_text,
+    get_pdf_file_paths,
+    read_pdf_file_text_directly,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the pdf files read per second when the pdfminer resources"
+        + " are set up for each pdf file and when they are shared across pdf files."
+    )
+    parser.add_argument(
+        "-p",
+        "--pdf_folder_input_path",
+        help="The folder path that contains the pdf files (ideally from a same template).",
+        required=True,
+    )
+    parser.add_argument(
+        "-n",
+        "--n_rounds",
+        help="The number of times the pdf files are read by each setup (default: 3).",
+        type=int,
+        default=3,
+    )
+    args = parser.parse_args()
+    pdf_folder_input_path = Path(args.pdf_folder_input_path)
+    n_rounds = args.n_rounds
+    assert (
+        pdf_folder_input_path.exists() and pdf_folder_input_path.is_dir()
+    ), "The input pdf folder does not exist or is not a folder directory."
+    assert n_rounds >= 1, f"The number of rounds should be at least 1, got {n_rounds}"
+    return pdf_folder_input_path, n_rounds
+
+
+def read_pdf_file_text_with_new_resources(path: Path) -> Optional[str]:
+    """
+    The text layer reading as it was before PdfTextLayerExtractor, i.e.
+    with pdfminer resources set up for every pdf file.
+    """
+    with path.open("rb") as file:
+        parser = PDFParser(file)
+        document = PDFDocument(parser, "")
+        if not document.is_extractable:
+            return None
+        manager = PDFResourceManager()
+        device = PDFPageAggregator(manager, laparams=LAParams())
+        interpreter = PDFPageInterpreter(manager, device)
+        page_texts = []
+        for page in PDFPage.create_pages(document):
+            interpreter.process_page(page)
+            page_texts.append(get_layout_text(device.get_result()))
+    return "".join(page_texts)
+
+
+def read_pdf_file_text_with_shared_resources(
+    path: Path, extractor: PdfTextLayerExtractor
+) -> Optional[str]:
+    result = read_pdf_file_text_directly(path, extractor=extractor)
+    return result[0] if result is not None else None
+
+
+def get_readable_pdf_file_paths(pdf_file_paths: List[Path]) -> List[Path]:
+    """
+    The pdf files whose text layer can be read, the others (e.g. damaged or
+    not allowing text extraction) are left out of the benchmark.
+    """
+    readable_pdf_file_paths = []
+    for path in pdf_file_paths:
+        try:
+            text = read_pdf_file_text_with_new_resources(path)
+        except Exception as e:
+            print(f"Skipping {path.name}, {type(e).__name__}: {e}")
+            continue
+        if text is None:
+            print(f"Skipping {path.name}, it does not allow text extraction")
+            continue
+        readable_pdf_file_paths.append(path)
+    return readable_pdf_file_paths
+
+
+def get_docs_per_second(
+    read_pdf_file: Callable[[Path], Optional[str]],
+    pdf_file_paths: List[Path],
+    n_rounds: int,
+) -> float:
+    start_time = time.perf_counter()
+    for _ in range(n_rounds):
+        for path in pdf_file_paths:
+            read_pdf_file(path)
+    return n_rounds * len(pdf_file_paths) / (time.perf_counter() - start_time)
+
+
+def main():
+    pdf_folder_input_path, n_rounds = parse_args()
+    pdf_file_paths = get_readable_pdf_file_paths(
+        get_pdf_file_paths(pdf_folder_input_path)
+    )
+    assert len(pdf_file_paths) > 0, "No readable pdf files found."
+    extractor = PdfTextLayerExtractor()
+    # Both setups must extract the same text
+    for path in pdf_file_paths:
+        assert read_pdf_file_text_with_new_resources(
+            path
+        ) == read_pdf_file_text_with_shared_resources(
+            path, extractor
+        ), f"The text of {path.name} differs between the two setups."
+    new_resources_docs_per_second = get_docs_per_second(
+        read_pdf_file_text_with_new_resources, pdf_file_paths, n_rounds
+    )
+    shared_resources_docs_per_second = get_docs_per_second(
+        lambda path: read_pdf_file_text_with_shared_resources(path, extractor),
+        pdf_file_paths,
+        n_rounds,
+    )
+    print(f"{len(pdf_file_paths)} pdf files, {n_rounds} rounds")
+    print(f"Resources per pdf file: {new_resources_docs_per_second:.2f} docs/sec")
+    print(f"Shared resources: {shared_resources_docs_per_second:.2f} docs/sec")
+    print(
+        "Speedup: "
+        + f"{shared_resources_docs_per_second / new_resources_docs_per_second:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
-from script.pdf_txt.utils import read_args, read_pdf_text, write_text
+from contextlib import nullcontext
+
+from script.pdf_txt.utils import (
+    PdfTextManifest,
+    get_changed_pdf_file_paths,
+    get_pdf_file_paths,
+    read_args,
+    read_pdf_text,
+    write_text,
+)
 
 
 def main():
@@ -8,6 +17,14 @@ def main():
 
     Example:
     python pdf_txt.py --report_type=ultrasound --pdf_folder_input_path=pdf --text_folder_output_path=txt
+    Add --workers=N to convert the pdf files with N processes and --incremental
+    to only convert the pdf files that changed since the last run. By default,
+    the text layer of ultrasound reports is read and the other reports are OCRed.
+    --strategy=hybrid reads the text layer and only OCRs the pages without a
+    usable one. --stop_at_body_end skips the pages after the end of the body of
+    ultrasound reports. Add --ocr_threads=N to OCR N pages at a time and
+    --image_folder_output_path=img to keep the images of the pages. The pages are
+    rendered --pages_per_window at a time (see read_args for the other OCR options).
     Input:
         pdf
         ├─a.pdf
@@ -25,15 +42,44 @@ def main():
         pdf_folder_input_path,
         text_folder_output_path,
         image_output_folder_path,
+        workers,
+        incremental,
+        ocr_params,
+        strategy,
+        text_layer_params,
+        body_markers,
     ) = read_args()
-    # Read pdf files and convert to text files
-    print("Reading pdf files...")
-    pdf_text_dict = read_pdf_text(
-        pdf_folder_input_path, report_type, image_output_folder_path
-    )
-    # Write out each text file using the same pdf file name
-    print("Writing text files...")
-    write_text(pdf_text_dict, text_folder_output_path)
+    pdf_file_paths = get_pdf_file_paths(pdf_folder_input_path)
+    # With --incremental, the manifest keeps track of the converted pdf files
+    with (
+        PdfTextManifest(
+            text_folder_output_path,
+            report_type,
+            strategy,
+            ocr_params=ocr_params,
+            text_layer_params=text_layer_params,
+            stop_at_body_end=body_markers is not None,
+        )
+        if incremental
+        else nullcontext()
+    ) as manifest:
+        if manifest is not None:
+            pdf_file_paths = get_changed_pdf_file_paths(pdf_file_paths, manifest)
+        # Lazily read the pdf files, one text at a time
+        print("Converting pdf files to text files...")
+        pdf_texts = read_pdf_text(
+            pdf_file_paths,
+            report_type,
+            image_output_folder_path,
+            workers=workers,
+            ocr_params=ocr_params,
+            strategy=strategy,
+            text_layer_params=text_layer_params,
+            body_markers=body_markers,
+            on_failure=manifest.record_failure if manifest is not None else None,
+        )
+        # Write out each text file using the same pdf file name as soon as it is read
+        write_text(pdf_texts, text_folder_output_path, manifest=manifest)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
 import argparse
+import hashlib
 import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from PIL import Image
 
+import jsonlines
 import pdf2image
 import pytesseract
 from pdfminer.converter import PDFPageAggregator
@@ -12,8 +18,40 @@ from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
 from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFParser
+from script.prepare_ultrasound_reports.prepare_ultrasound_reports import (
+    BODY_BEGIN_MARKERS,
+    BODY_END_MARKERS,
+)
+from src.utils.text_extraction import Markers, MarkerMatcher, marker_is_in_text
+from tqdm import tqdm
 
 REPORT_TYPES = {"surgical", "ultrasound", "pathology"}
+# direct: text layer only (pdfminer), ocr: OCR only (tesseract),
+# hybrid: text layer and OCR of the pages without a usable text layer
+STRATEGIES = {"direct", "ocr", "hybrid"}
+DEFAULT_STRATEGIES = {"ultrasound": "direct", "surgical": "ocr", "pathology": "ocr"}
+TEXT_LAYER_PAGE_SOURCE = "text_layer"
+OCR_PAGE_SOURCE = "ocr"
+# Characters that pdfminer cannot map to unicode are written as (cid:123)
+UNMAPPED_CHARACTER_PATTERN = re.compile(r"\(cid:\d+\)")
+DEFAULT_MIN_TEXT_LAYER_CHARS = 20
+DEFAULT_MIN_TEXT_LAYER_QUALITY = 0.5
+# Upper bound on the number of pdf files sent to a worker at once, which
+# together with MAX_PENDING_CHUNKS_PER_WORKER bounds the texts held in memory
+MAX_CHUNKSIZE = 16
+MAX_PENDING_CHUNKS_PER_WORKER = 2
+MANIFEST_FILE_NAME = ".pdf_txt_manifest.jsonl"
+# To be bumped whenever a change to the extraction code changes the
+# extracted text, so that --incremental runs convert every pdf file again
+EXTRACTOR_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+NOT_EXTRACTABLE_ERROR = "The pdf file does not allow text extraction"
+# Same default resolution as pdf2image
+DEFAULT_DPI = 200
+DEFAULT_PAGES_PER_WINDOW = 4
+# The OCR parameters that the manifest keeps track of, the others
+# (e.g. the number of threads) do not change the extracted text
+TEXT_CHANGING_OCR_PARAMS = ["dpi", "grayscale", "max_pages"]
 
 
 def read_args() -> Tuple[Path, Path]:
@@ -41,26 +79,123 @@ def read_args() -> Tuple[Path, Path]:
     parser.add_argument(
         "-i",
         "--image_folder_output_path",
-        help="The folder path that will be used to save the images of the pdf"
-        + " (not required for ultrasound reports).",
+        help="The folder path that will be used to save the images of the pdf pages"
+        + " (optional, only used for the reports that go through OCR).",
         required=False,
     )
+    parser.add_argument(
+        "-s",
+        "--strategy",
+        help=f"How the text is extracted, one of {STRATEGIES}. Defaults to direct for"
+        + " ultrasound reports and to ocr for the other reports.",
+        required=False,
+    )
+    parser.add_argument(
+        "--stop_at_body_end",
+        help="With the direct strategy, stop reading a pdf file once the end of the"
+        + " ultrasound report body is reached (see prepare_ultrasound_reports).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--min_text_layer_chars",
+        help="With the hybrid strategy, pages whose text layer has fewer alphanumeric"
+        + f" characters are OCRed (default: {DEFAULT_MIN_TEXT_LAYER_CHARS}).",
+        type=int,
+        default=DEFAULT_MIN_TEXT_LAYER_CHARS,
+    )
+    parser.add_argument(
+        "--min_text_layer_quality",
+        help="With the hybrid strategy, pages whose text layer has a lower share of"
+        + " alphanumeric characters are OCRed"
+        + f" (default: {DEFAULT_MIN_TEXT_LAYER_QUALITY}).",
+        type=float,
+        default=DEFAULT_MIN_TEXT_LAYER_QUALITY,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="The number of processes used to convert the pdf files (default: 1, i.e. serial).",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--ocr_threads",
+        help="The number of pages of a pdf file that are OCRed concurrently (default: 1).",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--dpi",
+        help=f"The resolution at which the pdf pages are rendered for OCR (default: {DEFAULT_DPI}).",
+        type=int,
+        default=DEFAULT_DPI,
+    )
+    parser.add_argument(
+        "--grayscale",
+        help="Render the pdf pages in grayscale for OCR.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pages_per_window",
+        help="The maximum number of pages of a pdf file rendered in memory at once"
+        + f" (default: {DEFAULT_PAGES_PER_WINDOW}).",
+        type=int,
+        default=DEFAULT_PAGES_PER_WINDOW,
+    )
+    parser.add_argument(
+        "--max_pages",
+        help="Only OCR the first max_pages pages of each pdf file (default: all pages)."
+        + " With --strategy=hybrid, the text layer of the other pages is still read.",
+        type=int,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Skip the pdf files that did not change since the last --incremental"
+        + f" run, as recorded in the {MANIFEST_FILE_NAME} file of the text output"
+        + " folder, including those which could not be converted.",
+        action="store_true",
+    )
     args = parser.parse_args()
     report_type = args.report_type
     pdf_folder_input_path = Path(args.pdf_folder_input_path)
     text_folder_output_path = Path(args.text_folder_output_path)
     image_folder_output_path = args.image_folder_output_path
+    workers = args.workers
+    incremental = args.incremental
+    ocr_params = {
+        "ocr_threads": args.ocr_threads,
+        "dpi": args.dpi,
+        "grayscale": args.grayscale,
+        "pages_per_window": args.pages_per_window,
+        "max_pages": args.max_pages,
+    }
+    text_layer_params = {
+        "min_text_layer_chars": args.min_text_layer_chars,
+        "min_text_layer_quality": args.min_text_layer_quality,
+    }
     assert report_type in REPORT_TYPES, f"Invalid report type: {report_type}"
+    strategy = get_strategy(report_type, args.strategy)
+    assert (
+        not args.stop_at_body_end or strategy == "direct"
+    ), "--stop_at_body_end is only supported by the direct strategy."
+    body_markers = (
+        (MarkerMatcher(BODY_BEGIN_MARKERS), MarkerMatcher(BODY_END_MARKERS))
+        if args.stop_at_body_end
+        else None
+    )
+    assert workers >= 1, f"The number of workers should be at least 1, got {workers}"
+    assert all(
+        ocr_params[name] >= 1
+        for name in ["ocr_threads", "dpi", "pages_per_window"]
+        + ([] if args.max_pages is None else ["max_pages"])
+    ), f"The OCR parameters should be positive, got {ocr_params}"
     assert (
         pdf_folder_input_path.exists() and pdf_folder_input_path.is_dir()
     ), "The input pdf folder does not exist or is not a folder directory."
     if not text_folder_output_path.exists():
         print("The output text folder does not exist, creating it.")
         os.makedirs(text_folder_output_path)
-    if report_type != "ultrasound":
-        assert (
-            image_folder_output_path is not None
-        ), "The image folder output path is required for {report_type} report types."
+    if image_folder_output_path is not None:
         image_folder_output_path = Path(image_folder_output_path)
         if not image_folder_output_path.exists():
             print("The output image folder does not exist, creating it.")
@@ -70,66 +205,612 @@ def read_args() -> Tuple[Path, Path]:
         pdf_folder_input_path,
         text_folder_output_path,
         image_folder_output_path,
+        workers,
+        incremental,
+        ocr_params,
+        strategy,
+        text_layer_params,
+        body_markers,
     )
 
 
+def get_chunksize(n_files: int, workers: int) -> int:
+    """
+    Number of pdf files sent to a worker at once. Same heuristic as
+    multiprocessing.Pool.map, i.e. about four chunks per worker, capped
+    at MAX_CHUNKSIZE.
+    """
+    chunksize, extra = divmod(n_files, workers * 4)
+    chunksize = chunksize + 1 if extra else max(chunksize, 1)
+    return min(chunksize, MAX_CHUNKSIZE)
+
+
+def _map_chunk(function: Callable, chunk: List) -> List:
+    return [function(item) for item in chunk]
+
+
+def map_in_bounded_chunks(
+    executor: ProcessPoolExecutor,
+    function: Callable,
+    items: List,
+    chunksize: int,
+    max_pending_chunks: int,
+) -> Iterator:
+    """
+    Ordered equivalent of executor.map(function, items, chunksize=chunksize)
+    which never has more than max_pending_chunks chunks submitted at once.
+    executor.map submits everything upfront and keeps every finished
+    result around until it is consumed.
+    """
+    pending_chunks = deque()
+    for start in range(0, len(items), chunksize):
+        if len(pending_chunks) >= max_pending_chunks:
+            yield from pending_chunks.popleft().result()
+        pending_chunks.append(
+            executor.submit(_map_chunk, function, items[start : start + chunksize])
+        )
+    while pending_chunks:
+        yield from pending_chunks.popleft().result()
+
+
+def get_pdf_file_paths(pdf_folder_input_path: Path) -> List[Path]:
+    return list(Path(pdf_folder_input_path).glob("*.pdf"))
+
+
+def get_strategy(report_type: str, strategy: Optional[str] = None) -> str:
+    strategy = strategy if strategy is not None else DEFAULT_STRATEGIES[report_type]
+    assert strategy in STRATEGIES, f"Invalid strategy: {strategy}"
+    return strategy
+
+
 def read_pdf_text(
-    pdf_file_path: Path, report_type: str, image_output_folder_path: Path
-) -> Dict[str, str]:
-    if report_type == "ultrasound":
-        return read_pdf_text_directly(pdf_file_path)
+    pdf_file_paths: List[Path],
+    report_type: str,
+    image_output_folder_path: Optional[Path],
+    workers: int = 1,
+    ocr_params: Optional[dict] = None,
+    strategy: Optional[str] = None,
+    text_layer_params: Optional[dict] = None,
+    body_markers: Optional[Tuple[Markers, Markers]] = None,
+    on_failure: Optional[Callable[[Path, str], None]] = None,
+) -> Iterator[Tuple[Path, str, List[str]]]:
+    """
+    Lazily read the text of every pdf file and yield it as (pdf file path, text,
+    page sources) tuples, one document at a time. The page sources tell for each
+    page whether its text comes from the text layer or from OCR.
+
+    The strategy defaults to the one of the report type (see DEFAULT_STRATEGIES).
+    With more than one worker, the pdf files are spread in chunks across a
+    process pool and only a bounded number of chunks are in flight. A pdf file
+    that cannot be read is reported and left out without affecting the others,
+    on_failure(pdf file path, error message) is called for each of them.
+    ocr_params and text_layer_params are the keyword arguments of ocr_pdf_pages
+    and is_usable_text_layer respectively, body_markers is used by the direct
+    strategy to stop at the end of the report body.
+    """
+    read_pdf_file = partial(
+        read_pdf_file_text_safely,
+        strategy=get_strategy(report_type, strategy),
+        image_output_folder_path=image_output_folder_path,
+        ocr_params=ocr_params,
+        text_layer_params=text_layer_params,
+        body_markers=body_markers,
+    )
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    if executor is not None:
+        results = map_in_bounded_chunks(
+            executor,
+            read_pdf_file,
+            pdf_file_paths,
+            chunksize=get_chunksize(len(pdf_file_paths), workers),
+            max_pending_chunks=workers * MAX_PENDING_CHUNKS_PER_WORKER,
+        )
     else:
-        return read_pdf_text_indirectly(pdf_file_path, image_output_folder_path)
-
-
-def read_pdf_text_directly(pdf_file_path: Path) -> Dict[str, str]:
-    pdf_text_dict = {}
-    for path in Path(pdf_file_path).glob("*.pdf"):
-        with path.open("rb") as file:
-            parser = PDFParser(file)
-            document = PDFDocument(parser, "")
-            if not document.is_extractable:
-                continue
-
-            manager = PDFResourceManager()
-            params = LAParams()
-
-            device = PDFPageAggregator(manager, laparams=params)
-            interpreter = PDFPageInterpreter(manager, device)
-
-            text = ""
-
-            for page in PDFPage.create_pages(document):
-                interpreter.process_page(page)
-                for obj in device.get_result():
-                    if isinstance(obj, LTTextBox) or isinstance(obj, LTTextLine):
-                        text += obj.get_text()
-            pdf_text_dict[path.stem] = text
-    return pdf_text_dict
-
-
-def read_pdf_text_indirectly(
-    pdf_file_path: Path, image_output_folder_path: Path
-) -> Dict[str, str]:
-    pdf_text_dict = {}
-    for path in Path(pdf_file_path).glob("*.pdf"):
-        file_path_stem = path.stem
-        pdf_text_dict[file_path_stem] = []
-        # Convert the pdf to images
-        images = pdf2image.convert_from_path(path)
-        for i, image in enumerate(images):
-            image_path = os.path.join(
-                image_output_folder_path, f"{file_path_stem}_{i}.png"
+        results = map(read_pdf_file, pdf_file_paths)
+    try:
+        for path, (result, error) in tqdm(
+            zip(pdf_file_paths, results), total=len(pdf_file_paths)
+        ):
+            if error is None and result is None:
+                error = NOT_EXTRACTABLE_ERROR
+            if error is not None:
+                tqdm.write(f"Could not read {path.name}: {error}")
+                if on_failure is not None:
+                    on_failure(path, error)
+            else:
+                text, page_sources = result
+                yield path, text, page_sources
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def read_pdf_file_text(
+    path: Path,
+    strategy: str,
+    image_output_folder_path: Optional[Path],
+    ocr_params: Optional[dict] = None,
+    text_layer_params: Optional[dict] = None,
+    body_markers: Optional[Tuple[Markers, Markers]] = None,
+) -> Optional[Tuple[str, List[str]]]:
+    """
+    Returns the text of the pdf file along with the source of each page.
+    """
+    if strategy == "direct":
+        return read_pdf_file_text_directly(path, body_markers=body_markers)
+    elif strategy == "ocr":
+        return read_pdf_file_text_indirectly(
+            path, image_output_folder_path, **(ocr_params or {})
+        )
+    elif strategy == "hybrid":
+        return read_pdf_file_text_hybrid(
+            path,
+            image_output_folder_path,
+            ocr_params=ocr_params,
+            text_layer_params=text_layer_params,
+        )
+    else:
+        raise ValueError(f"Unknown strategy {strategy}.")
+
+
+def read_pdf_file_text_safely(
+    path: Path,
+    strategy: str,
+    image_output_folder_path: Optional[Path],
+    ocr_params: Optional[dict] = None,
+    text_layer_params: Optional[dict] = None,
+    body_markers: Optional[Tuple[Markers, Markers]] = None,
+) -> Tuple[Optional[Tuple[str, List[str]]], Optional[str]]:
+    """
+    Same as read_pdf_file_text but returns the error message instead of raising,
+    so that a single bad pdf file does not bring down a whole batch (or pool).
+    """
+    try:
+        result = read_pdf_file_text(
+            path,
+            strategy,
+            image_output_folder_path,
+            ocr_params=ocr_params,
+            text_layer_params=text_layer_params,
+            body_markers=body_markers,
+        )
+        return result, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def get_layout_text(layout_objects: Iterable) -> str:
+    return "".join(
+        obj.get_text()
+        for obj in layout_objects
+        if isinstance(obj, LTTextBox) or isinstance(obj, LTTextLine)
+    )
+
+
+class PdfTextLayerExtractor:
+    """
+    pdfminer resources (resource manager, layout parameters, page aggregator
+    and interpreter) set up once and reused for every pdf file read by a
+    process.
+    """
+
+    def __init__(self):
+        self.manager = PDFResourceManager()
+        self.params = LAParams()
+        self.device = PDFPageAggregator(self.manager, laparams=self.params)
+        self.interpreter = PDFPageInterpreter(self.manager, self.device)
+
+    def iter_page_texts(self, document: PDFDocument) -> Iterator[str]:
+        """
+        Lazily analyse the layout of each page of the document and yield its text.
+        """
+        # pdfminer caches the fonts by object id, which only identifies a font
+        # within a pdf file
+        self.manager._cached_fonts.clear()
+        for page in PDFPage.create_pages(document):
+            self.interpreter.process_page(page)
+            yield get_layout_text(self.device.get_result())
+
+
+@lru_cache(maxsize=None)
+def get_text_layer_extractor() -> PdfTextLayerExtractor:
+    """
+    The extractor of the current process, each pool worker gets its own.
+    """
+    return PdfTextLayerExtractor()
+
+
+def is_body_end_in_text(
+    text: str,
+    body_markers: Tuple[Markers, Markers],
+    body_begun: bool = False,
+) -> Tuple[bool, bool]:
+    """
+    Go through the lines of the text like extract_text_between_markers does
+    with the (begin markers, end markers) pair and return whether the body has
+    begun and whether it has ended. An end marker only counts once the body
+    has begun, i.e. once a begin marker has been seen in this text or before
+    (body_begun).
+    """
+    body_begin_markers, body_end_markers = body_markers
+    for line in text.splitlines():
+        if not body_begun:
+            body_begun = marker_is_in_text(body_begin_markers, line)
+        if body_begun and marker_is_in_text(body_end_markers, line):
+            return body_begun, True
+    return body_begun, False
+
+
+def read_pdf_file_text_directly(
+    path: Path,
+    body_markers: Optional[Tuple[Markers, Markers]] = None,
+    extractor: Optional["PdfTextLayerExtractor"] = None,
+) -> Optional[Tuple[str, List[str]]]:
+    """
+    Returns None if the pdf file does not allow text extraction. With
+    body_markers, a (begin markers, end markers) pair, the pages after the
+    end of the report body are not processed since everything after the
+    end marker is thrown away when the body is extracted. The extractor
+    defaults to the one of the process.
+    """
+    with path.open("rb") as file:
+        parser = PDFParser(file)
+        document = PDFDocument(parser, "")
+        if not document.is_extractable:
+            return None
+
+        extractor = extractor or get_text_layer_extractor()
+
+        page_texts = []
+        page_sources = []
+        body_begun = False
+
+        for page_text in extractor.iter_page_texts(document):
+            page_texts.append(page_text)
+            page_sources.append(TEXT_LAYER_PAGE_SOURCE)
+            if body_markers is not None:
+                body_begun, body_ended = is_body_end_in_text(
+                    page_texts[-1], body_markers, body_begun=body_begun
+                )
+                if body_ended:
+                    break
+    return "".join(page_texts), page_sources
+
+
+def get_text_layer_quality(text: str) -> float:
+    """
+    Share of the non whitespace characters of the text that are alphanumeric.
+    Characters that pdfminer could not map to unicode, (cid:123), count as one
+    bad character each.
+    """
+    n_unmapped_characters = len(UNMAPPED_CHARACTER_PATTERN.findall(text))
+    text = UNMAPPED_CHARACTER_PATTERN.sub("", text)
+    n_characters = sum(not char.isspace() for char in text) + n_unmapped_characters
+    n_alphanumeric_characters = sum(char.isalnum() for char in text)
+    return n_alphanumeric_characters / n_characters if n_characters > 0 else 0.0
+
+
+def is_usable_text_layer(
+    text: str,
+    min_text_layer_chars: int = DEFAULT_MIN_TEXT_LAYER_CHARS,
+    min_text_layer_quality: float = DEFAULT_MIN_TEXT_LAYER_QUALITY,
+) -> bool:
+    return (
+        sum(char.isalnum() for char in text) >= min_text_layer_chars
+        and get_text_layer_quality(text) >= min_text_layer_quality
+    )
+
+
+def read_pdf_file_text_hybrid(
+    path: Path,
+    image_output_folder_path: Optional[Path],
+    ocr_params: Optional[dict] = None,
+    text_layer_params: Optional[dict] = None,
+) -> Tuple[str, List[str]]:
+    """
+    Read the text layer of each page with pdfminer and only OCR the pages
+    whose text layer is missing or not usable (see is_usable_text_layer).
+    Every page is OCRed if the pdf file does not allow text extraction. The
+    max_pages of ocr_params only limits the OCR, the text layer of the pages
+    after the first max_pages is kept even when it is not usable.
+    """
+    ocr_params = ocr_params or {}
+    max_pages = ocr_params.get("max_pages")
+    page_texts = []
+    with path.open("rb") as file:
+        parser = PDFParser(file)
+        document = PDFDocument(parser, "")
+        if document.is_extractable:
+            page_texts = list(get_text_layer_extractor().iter_page_texts(document))
+    if not page_texts:
+        # No text layer to read
+        return read_pdf_file_text_indirectly(
+            path, image_output_folder_path, **ocr_params
+        )
+    ocr_page_numbers = [
+        page_number
+        for page_number, text in enumerate(page_texts, 1)
+        if (max_pages is None or page_number <= max_pages)
+        and not is_usable_text_layer(text, **(text_layer_params or {}))
+    ]
+    ocr_page_texts = ocr_pdf_pages(
+        path, image_output_folder_path, page_numbers=ocr_page_numbers, **ocr_params
+    )
+    page_sources = [TEXT_LAYER_PAGE_SOURCE] * len(page_texts)
+    for page_number, text in zip(ocr_page_numbers, ocr_page_texts):
+        page_texts[page_number - 1] = text
+        page_sources[page_number - 1] = OCR_PAGE_SOURCE
+    return "".join(page_texts), page_sources
+
+
+def _get_page_ranges(page_numbers: List[int]) -> List[Tuple[int, int]]:
+    """
+    Group the sorted page numbers into ranges of consecutive pages.
+    """
+    page_ranges = []
+    for page_number in page_numbers:
+        if page_ranges and page_ranges[-1][1] == page_number - 1:
+            page_ranges[-1] = (page_ranges[-1][0], page_number)
+        else:
+            page_ranges.append((page_number, page_number))
+    return page_ranges
+
+
+def render_pdf_pages(
+    path: Path,
+    page_numbers: Optional[List[int]] = None,
+    dpi: int = DEFAULT_DPI,
+    grayscale: bool = False,
+    pages_per_window: int = DEFAULT_PAGES_PER_WINDOW,
+    max_pages: Optional[int] = None,
+) -> Iterator[Tuple[List[int], List[Image.Image]]]:
+    """
+    Render the given pages of the pdf file (all of them by default) in windows
+    of at most pages_per_window pages, only the first max_pages pages if given.
+    Yields the page numbers (starting at 1) of each window with their images.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, pdf2image.pdfinfo_from_path(path)["Pages"] + 1)
+    if max_pages is not None:
+        page_numbers = [
+            page_number for page_number in page_numbers if page_number <= max_pages
+        ]
+    for start in range(0, len(page_numbers), pages_per_window):
+        window_page_numbers = list(page_numbers[start : start + pages_per_window])
+        images = []
+        for first_page, last_page in _get_page_ranges(window_page_numbers):
+            images.extend(
+                pdf2image.convert_from_path(
+                    path,
+                    dpi=dpi,
+                    grayscale=grayscale,
+                    first_page=first_page,
+                    last_page=last_page,
+                )
             )
-            image.save(image_path, "PNG")
-            img = Image.open(image_path)
-            pdf_text_dict[file_path_stem].append(pytesseract.image_to_string(img))
-        pdf_text_dict[file_path_stem] = "".join(pdf_text_dict[file_path_stem])
-    return pdf_text_dict
-
-
-def write_text(pdf_text_dict: Dict[str, str], text_folder_output_path: Path) -> None:
-    for path_stem, text in pdf_text_dict.items():
-        output_file_path = os.path.join(text_folder_output_path, f"{path_stem}.txt")
-        with open(output_file_path, "w") as file:
-            file.write(text)
+        yield window_page_numbers, images
+
+
+def ocr_pdf_pages(
+    path: Path,
+    image_output_folder_path: Optional[Path],
+    page_numbers: Optional[List[int]] = None,
+    ocr_threads: int = 1,
+    dpi: int = DEFAULT_DPI,
+    grayscale: bool = False,
+    pages_per_window: int = DEFAULT_PAGES_PER_WINDOW,
+    max_pages: Optional[int] = None,
+) -> List[str]:
+    """
+    OCR the given pages of the pdf file (all of them by default) and return
+    the text of each page. The pages are rendered and OCRed one window at a
+    time so that at most pages_per_window images are held in memory. The
+    rendered images are given to tesseract directly, they are only saved if
+    an image output folder is given.
+    """
+    page_texts = []
+    for window_page_numbers, images in render_pdf_pages(
+        path,
+        page_numbers=page_numbers,
+        dpi=dpi,
+        grayscale=grayscale,
+        pages_per_window=pages_per_window,
+        max_pages=max_pages,
+    ):
+        if image_output_folder_path is not None:
+            for page_number, image in zip(window_page_numbers, images):
+                image_path = os.path.join(
+                    image_output_folder_path, f"{path.stem}_{page_number - 1}.png"
+                )
+                image.save(image_path, "PNG")
+        page_texts.extend(ocr_images(images, ocr_threads=ocr_threads))
+        # Release the window before the next one is rendered
+        del images
+    return page_texts
+
+
+def read_pdf_file_text_indirectly(
+    path: Path, image_output_folder_path: Optional[Path], **ocr_params
+) -> Tuple[str, List[str]]:
+    """
+    OCR every page of the pdf file, see ocr_pdf_pages for the parameters.
+    """
+    page_texts = ocr_pdf_pages(path, image_output_folder_path, **ocr_params)
+    return "".join(page_texts), [OCR_PAGE_SOURCE] * len(page_texts)
+
+
+def ocr_images(images: List[Image.Image], ocr_threads: int = 1) -> List[str]:
+    """
+    OCR the images in order. tesseract runs as a subprocess so threads are
+    enough to OCR several images concurrently.
+    """
+    if ocr_threads > 1 and len(images) > 1:
+        with ThreadPoolExecutor(max_workers=ocr_threads) as executor:
+            return list(executor.map(pytesseract.image_to_string, images))
+    return [pytesseract.image_to_string(image) for image in images]
+
+
+def get_file_hash(file_path: Path) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class PdfTextManifest:
+    """
+    Sidecar .jsonl file of the text output folder with one entry per converted
+    pdf file: its content hash, size, modification time, report type, the
+    extraction parameters that change the extracted text, the extractor version
+    and the source (text layer or OCR) of each page. The pdf files which could
+    not be converted get an entry too, with their error, so that they are not
+    tried again until they change. A pdf file whose size and modification time
+    match its entry is considered unchanged without being read. Otherwise, it is
+    only considered unchanged if its content hash matches.
+    """
+
+    def __init__(
+        self,
+        text_folder_output_path: Path,
+        report_type: str,
+        strategy: str,
+        ocr_params: Optional[dict] = None,
+        text_layer_params: Optional[dict] = None,
+        stop_at_body_end: bool = False,
+    ):
+        self.text_folder_output_path = Path(text_folder_output_path)
+        self.manifest_path = self.text_folder_output_path / MANIFEST_FILE_NAME
+        self.report_type = report_type
+        self.extraction_params = {
+            "strategy": strategy,
+            **{name: (ocr_params or {}).get(name) for name in TEXT_CHANGING_OCR_PARAMS},
+            **((text_layer_params or {}) if strategy == "hybrid" else {}),
+            "stop_at_body_end": stop_at_body_end,
+        }
+        self.entries = self._read_entries()
+        # Hashes computed while checking for changes, reused when recording
+        self._file_hashes = {}
+        # Entries are appended as files are converted so that an interrupted
+        # run keeps track of its progress, start from a compacted manifest
+        self._write_entries()
+        self._writer = jsonlines.open(self.manifest_path, mode="a", flush=True)
+
+    def __enter__(self) -> "PdfTextManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def _read_entries(self) -> Dict[str, dict]:
+        entries = {}
+        if self.manifest_path.exists():
+            with jsonlines.open(self.manifest_path) as reader:
+                # The last entry of a file is the most recent one
+                for entry in reader.iter(skip_invalid=True):
+                    entries[entry["name"]] = entry
+        return entries
+
+    def _write_entries(self) -> None:
+        temporary_manifest_path = f"{self.manifest_path}.tmp"
+        with jsonlines.open(temporary_manifest_path, mode="w") as writer:
+            writer.write_all(self.entries.values())
+        os.replace(temporary_manifest_path, self.manifest_path)
+
+    def is_unchanged(self, path: Path) -> bool:
+        entry = self.entries.get(path.name)
+        if (
+            entry is None
+            or entry["report_type"] != self.report_type
+            or entry.get("extraction_params") != self.extraction_params
+            or entry["extractor_version"] != EXTRACTOR_VERSION
+            or (
+                entry.get("error") is None
+                and not (self.text_folder_output_path / f"{path.stem}.txt").exists()
+            )
+        ):
+            return False
+        stat = path.stat()
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        # Same size but touched, only the content can tell
+        self._file_hashes[path.name] = get_file_hash(path)
+        if self._file_hashes[path.name] != entry["sha256"]:
+            return False
+        # Refresh the modification time so the next run does not hash it again
+        self.record(
+            path, page_sources=entry.get("page_sources"), error=entry.get("error")
+        )
+        return True
+
+    def record(
+        self,
+        path: Path,
+        page_sources: Optional[List[str]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        stat = path.stat()
+        file_hash = self._file_hashes.pop(path.name, None) or get_file_hash(path)
+        entry = {
+            "name": path.name,
+            "sha256": file_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "report_type": self.report_type,
+            "extraction_params": self.extraction_params,
+            "extractor_version": EXTRACTOR_VERSION,
+            "page_sources": page_sources,
+            "error": error,
+        }
+        self._writer.write(entry)
+        self.entries[path.name] = entry
+
+    def record_failure(self, path: Path, error: str) -> None:
+        self.record(path, error=error)
+
+
+def get_changed_pdf_file_paths(
+    pdf_file_paths: List[Path], manifest: PdfTextManifest
+) -> List[Path]:
+    changed_pdf_file_paths = [
+        path for path in pdf_file_paths if not manifest.is_unchanged(path)
+    ]
+    print(
+        f"Skipping {len(pdf_file_paths) - len(changed_pdf_file_paths)} unchanged"
+        + f" pdf files, {len(changed_pdf_file_paths)} left to convert."
+    )
+    return changed_pdf_file_paths
+
+
+def write_text(
+    pdf_texts: Iterable[Tuple[Path, str, List[str]]],
+    text_folder_output_path: Path,
+    manifest: Optional[PdfTextManifest] = None,
+) -> None:
+    """
+    Write each text as soon as it is produced so that only one document
+    is held in memory and a crash does not lose the files already written.
+    Each written file is recorded in the manifest, if any, along with the
+    source of each of its pages.
+    """
+    for path, text, page_sources in pdf_texts:
+        output_file_path = os.path.join(text_folder_output_path, f"{path.stem}.txt")
+        write_text_file_atomically(text, output_file_path)
+        if manifest is not None:
+            manifest.record(path, page_sources=page_sources)
+
+
+def write_text_file_atomically(text: str, output_file_path: str) -> None:
+    """
+    Write to a temporary file in the same folder then rename it, so that
+    an interrupted run never leaves a truncated .txt file behind.
+    """
+    temporary_file_path = f"{output_file_path}.tmp"
+    with open(temporary_file_path, "w") as file:
+        file.write(text)
+    os.replace(temporary_file_path, output_file_path)
@@ -3,6 +3,7 @@ from script.prepare_ultrasound_reports.utils import (
     get_ultrasound_text_file_paths,
     parse_args,
     write_ultrasound_text_bodies,
+    write_ultrasound_text_bodies_to_shards,
 )
 
 # Constants, to be updated as more data is added
@@ -17,7 +18,14 @@ BODY_BETWEEN_END_MARKERS = ["Rapport/Report"]
 
 def main():
     # Parse the command line arguments
-    ultrasound_folder_input_path, output_folder_path = parse_args()
+    (
+        ultrasound_folder_input_path,
+        output_folder_path,
+        workers,
+        output_format,
+        n_shards,
+        compression,
+    ) = parse_args()
     # Collect the ultrasound text file paths
     ultrasound_text_file_paths = get_ultrasound_text_file_paths(
         ultrasound_folder_input_path, excluded_files=EXCLUDED_FILES
@@ -29,11 +37,21 @@ def main():
         body_end_markers=BODY_END_MARKERS,
         body_between_start_markers=BODY_BETWEEN_START_MARKERS,
         body_between_end_markers=BODY_BETWEEN_END_MARKERS,
+        workers=workers,
     )
     # Write the ultrasound text bodies to the output folder
-    write_ultrasound_text_bodies(
-        ultrasound_text_bodies, output_folder_path, ultrasound_text_file_paths
-    )
+    if output_format == "jsonl":
+        write_ultrasound_text_bodies_to_shards(
+            ultrasound_text_bodies,
+            output_folder_path,
+            ultrasound_text_file_paths,
+            n_shards=n_shards,
+            compression=compression,
+        )
+    else:
+        write_ultrasound_text_bodies(
+            ultrasound_text_bodies, output_folder_path, ultrasound_text_file_paths
+        )
 
 
 if __name__ == "__main__":
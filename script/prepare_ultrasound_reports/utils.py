@@ -1,16 +1,32 @@
 import argparse
 import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import List
 
+from src.utils.json import COMPRESSION_SUFFIXES, JsonlinesWriter
 from src.utils.text_extraction import (
-    extract_text_between_markers,
-    delete_text_between_markers,
-    remove_whitespace_lines,
-    strip_text_lines,
+    Markers,
+    get_marker_matcher,
+    iter_delete_text_between_markers,
+    iter_extract_text_between_markers,
+    iter_remove_whitespace_lines,
+    iter_strip_text_lines,
 )
 
 
+OUTPUT_FORMATS = ["txt", "jsonl"]
+DEFAULT_N_SHARDS = 8
+# Name of the .jsonl shards, numbered from 0, e.g. the first of 8 shards is
+# ultrasound_text_bodies-00000-of-00008.jsonl(.gz)
+SHARD_FILE_NAME = (
+    "ultrasound_text_bodies-{shard_index:05d}-of-{n_shards:05d}.jsonl{suffix}"
+)
+SHARD_FILE_PATTERN = "ultrasound_text_bodies-*-of-*.jsonl*"
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Extract the main text components from the ultrasound text files. Place them in processed folder."
@@ -27,19 +43,59 @@ def parse_args():
         help="The folder path that will be used to save the extracted text from the ultrasound text files.",
         required=True,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="The number of processes used to extract the text bodies (default: 1).",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--output_format",
+        help="Write one .txt file per report or a few .jsonl shards of"
+        + " {id, text} records keyed by report id (default: txt).",
+        choices=OUTPUT_FORMATS,
+        default="txt",
+    )
+    parser.add_argument(
+        "--n_shards",
+        help="The number of .jsonl shards written with --output_format jsonl"
+        + f" (default: {DEFAULT_N_SHARDS}).",
+        type=int,
+        default=DEFAULT_N_SHARDS,
+    )
+    parser.add_argument(
+        "--compression",
+        help="The compression of the .jsonl shards (default: none).",
+        choices=list(COMPRESSION_SUFFIXES),
+        default="none",
+    )
     args = parser.parse_args()
     ultrasound_folder_input_path = Path(args.ultrasound_folder_input_path)
     output_folder_path = Path(args.output_folder_path)
+    workers = args.workers
+    output_format = args.output_format
+    n_shards = args.n_shards
+    compression = args.compression
 
     assert (
         ultrasound_folder_input_path.exists() and ultrasound_folder_input_path.is_dir()
     ), "The ultrasound text file folder either does not exist or is not a folder directory."
+    assert workers >= 1, f"The number of workers should be at least 1, got {workers}"
+    assert n_shards >= 1, f"The number of shards should be at least 1, got {n_shards}"
 
     if not output_folder_path.exists():
         print("The output folder does not exist, creating it.")
         os.makedirs(output_folder_path)
 
-    return ultrasound_folder_input_path, output_folder_path
+    return (
+        ultrasound_folder_input_path,
+        output_folder_path,
+        workers,
+        output_format,
+        n_shards,
+        compression,
+    )
 
 
 def get_ultrasound_text_file_paths(
@@ -59,43 +115,63 @@ def get_ultrasound_text_file_paths(
 
 def get_ultrasound_text_body(
     ultrasound_text_file_path: Path,
-    body_begin_markers: List[str],
-    body_end_markers: List[str],
-    body_between_start_markers: List[str],
-    body_between_end_markers: List[str],
+    body_begin_markers: Markers,
+    body_end_markers: Markers,
+    body_between_start_markers: List[Markers],
+    body_between_end_markers: List[Markers],
 ) -> str:
+    # The file is read, trimmed and filtered line by line in a single pass
+    # which stops at the end of the body
     with open(ultrasound_text_file_path, "r") as f:
-        ultrasound_text_file_lines = f.readlines()
-        extracted_body = extract_text_between_markers(
-            body_begin_markers, body_end_markers, ultrasound_text_file_lines
+        extracted_body = iter_extract_text_between_markers(
+            body_begin_markers, body_end_markers, f
         )
-        extracted_body = delete_text_between_markers(
+        extracted_body = iter_delete_text_between_markers(
             body_between_start_markers, body_between_end_markers, extracted_body
         )
-        extracted_body = remove_whitespace_lines(extracted_body)
-        extracted_body = strip_text_lines(extracted_body)
-        return extracted_body
+        extracted_body = iter_remove_whitespace_lines(extracted_body)
+        extracted_body = iter_strip_text_lines(extracted_body)
+        return list(extracted_body)
 
 
 def get_ultrasound_text_bodies(
     ultrasound_text_file_paths: List[Path],
-    body_begin_markers: List[str],
-    body_end_markers: List[str],
-    body_between_start_markers: List[str],
-    body_between_end_markers: List[str],
+    body_begin_markers: Markers,
+    body_end_markers: Markers,
+    body_between_start_markers: List[Markers],
+    body_between_end_markers: List[Markers],
+    workers: int = 1,
 ) -> List[str]:
-    ultrasound_text_bodies = []
-    for ultrasound_text_file_path in ultrasound_text_file_paths:
-        ultrasound_text_bodies.append(
-            get_ultrasound_text_body(
-                ultrasound_text_file_path,
-                body_begin_markers=body_begin_markers,
-                body_end_markers=body_end_markers,
-                body_between_start_markers=body_between_start_markers,
-                body_between_end_markers=body_between_end_markers,
-            )
+    """
+    Text body of every ultrasound text file, as a list of lines, in the order
+    of the file paths. With more than one worker, the files are split in
+    chunks which are handled by a pool of processes.
+    """
+    # Compile the markers once for all the files
+    body_begin_markers = get_marker_matcher(body_begin_markers)
+    body_end_markers = get_marker_matcher(body_end_markers)
+    body_between_start_markers = [
+        get_marker_matcher(marker) for marker in body_between_start_markers
+    ]
+    body_between_end_markers = [
+        get_marker_matcher(marker) for marker in body_between_end_markers
+    ]
+    get_text_body = partial(
+        get_ultrasound_text_body,
+        body_begin_markers=body_begin_markers,
+        body_end_markers=body_end_markers,
+        body_between_start_markers=body_between_start_markers,
+        body_between_end_markers=body_between_end_markers,
+    )
+    if workers == 1:
+        return [get_text_body(path) for path in ultrasound_text_file_paths]
+    # About four chunks per worker, as multiprocessing.Pool.map does, so the
+    # files are not sent to the workers one by one
+    chunksize = max(len(ultrasound_text_file_paths) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(get_text_body, ultrasound_text_file_paths, chunksize=chunksize)
         )
-    return ultrasound_text_bodies
 
 
 def write_ultrasound_text_bodies(
@@ -109,3 +185,51 @@ def write_ultrasound_text_bodies(
         ultrasound_output_file_path = output_folder_path / ultrasound_file_path.name
         with open(ultrasound_output_file_path, "w") as f:
             f.write(" ".join(ultrasound_text_body))
+
+
+def get_shard_index(id_: str, n_shards: int) -> int:
+    """
+    Shard of a report id. crc32 rather than hash() which is salted per process.
+    """
+    return zlib.crc32(id_.encode("utf-8")) % n_shards
+
+
+def write_ultrasound_text_bodies_to_shards(
+    ultrasound_text_bodies: List[str],
+    output_folder_path: Path,
+    ultrasound_text_file_paths: List[Path],
+    n_shards: int,
+    compression: str = "none",
+) -> List[Path]:
+    """
+    Write the text bodies as {"id": report id, "text": body} records into
+    n_shards .jsonl files rather than one .txt file per report. The report id
+    is the name of the text file without its extension, as with the .txt
+    files, and a report is always written in the same shard. The shards are
+    compressed with gzip or zstd according to compression.
+    """
+    for old_shard_file_path in output_folder_path.glob(SHARD_FILE_PATTERN):
+        # Shards from a run with another number of shards or compression
+        os.remove(old_shard_file_path)
+    shard_file_paths = [
+        output_folder_path
+        / SHARD_FILE_NAME.format(
+            shard_index=shard_index,
+            n_shards=n_shards,
+            suffix=COMPRESSION_SUFFIXES[compression],
+        )
+        for shard_index in range(n_shards)
+    ]
+    writers = [JsonlinesWriter(path) for path in shard_file_paths]
+    try:
+        for ultrasound_text_body, ultrasound_file_path in zip(
+            ultrasound_text_bodies, ultrasound_text_file_paths
+        ):
+            id_ = ultrasound_file_path.stem
+            writers[get_shard_index(id_, n_shards)].write(
+                {"id": id_, "text": " ".join(ultrasound_text_body)}
+            )
+    finally:
+        for writer in writers:
+            writer.close()
+    return shard_file_paths
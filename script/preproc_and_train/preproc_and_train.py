@@ -1,11 +1,14 @@
 from script.preproc_and_train.utils import (
-    get_dataset,
+    TRAIN_TEST_RATIO_SPLIT,
+    get_feature_store,
+    get_preprocessed_dataset,
+    get_preprocessed_dataset_key,
     get_trained_classifier,
     log_results,
     parse_args,
-    preprocess_dataset,
+    vectorize_sets,
 )
-from src import LOG_CONFIG_PATH
+from src import LOG_CONFIG_PATH, RANDOM_SEED
 from src.utils.config import read_config
 from src.utils.logging import get_logger
 
@@ -23,15 +26,25 @@ def main():
     config_path = parse_args()
     # Read config (all config checks are made in this call)
     config = read_config(config_path)
-    # Get the dataset
-    dataset = get_dataset(config)
-    # Pre-process the dataset
-    dataset = preprocess_dataset(dataset, config)
+    # Key of the pre-processed dataset in the caches, which hashes the dataset
+    preprocessed_dataset_key = get_preprocessed_dataset_key(config)
+    # Get the pre-processed dataset, from the cache when it was already made
+    dataset, corpus = get_preprocessed_dataset(config, preprocessed_dataset_key)
+    # Get the features, joined to the dataset by row index
+    feature_store = get_feature_store(config)
     # Get train and test set
-    train_set, test_set = get_train_and_test_set(dataset)
+    train_set, test_set = get_train_and_test_set(
+        dataset,
+        train_test_ratio_split=TRAIN_TEST_RATIO_SPLIT,
+        seed=RANDOM_SEED,
+        feature_store=feature_store,
+        corpus=corpus,
+    )
+    # Vectorize the texts, from the cache when only the model changed
+    vectorizer = vectorize_sets(train_set, test_set, config, preprocessed_dataset_key)
     # TODO: Train (do one iteration for now,
     # then generalize to when you need to do a search)
-    classifier = get_trained_classifier(train_set, config)
+    classifier = get_trained_classifier(train_set, config, vectorizer=vectorizer)
     # Log results for visualization and analysis
     log_results(
         classifier, test_set, project_name=PROJECT_NAME, config_path=config_path
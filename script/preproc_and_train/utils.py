@@ -1,25 +1,31 @@
 import argparse
-import re
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
-import wandb
-from sklearn.pipeline import Pipeline
-from src import LOG_CONFIG_PATH, WANDB_ENTITY_NAME
+from src import LOG_CONFIG_PATH, RANDOM_SEED, WANDB_ENTITY_NAME
+from src.utils.corpus import TokenCorpus
+from src.utils.dataset_index import sample_jsonlines
+from src.utils.features import FeatureStore, read_feature_store
 from src.utils.json import read_jsonlines
 from src.utils.logging import get_logger
-from src.utils.preprocessing import (
-    lowercase_dataset,
-    remove_patterns_from_text,
-    split_measure_text,
-    tokenize_dataset,
+from src.utils.preprocessing import PreprocessingPipeline
+from src.utils.preprocessing_cache import (
+    PreprocessingCache,
+    get_preprocessing_cache_key,
 )
 from src.utils.training import (
+    VECTORIZER_DTYPES,
     create_classifier,
     create_model,
     create_vectorizer,
+    set_vectorizer_vocabulary,
     train_classifier,
 )
+from src.utils.vectorization_cache import (
+    DocumentTermMatrices,
+    VectorizationCache,
+    get_vectorization_cache_key,
+)
 from src.utils.wandb_visualization import (
     get_classification_report_visualization,
     get_confused_examples_visualization,
@@ -27,8 +33,14 @@ from src.utils.wandb_visualization import (
     get_data_for_logging,
 )
 
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    from sklearn.pipeline import Pipeline
+
 logger = get_logger(log_config_path=LOG_CONFIG_PATH, diplayed_logger_name=__file__)
 
+TRAIN_TEST_RATIO_SPLIT = 0.8
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -48,55 +60,157 @@ def parse_args():
 
 def get_dataset(config: dict) -> List[dict]:
     dataset_config = config["dataset"]
+    if dataset_config.get("n_samples") is not None:
+        return sample_jsonlines(
+            dataset_config["path"], dataset_config["n_samples"], seed=RANDOM_SEED
+        )
     return read_jsonlines(file_path=dataset_config["path"])
 
 
+def get_feature_store(config: dict) -> Optional[FeatureStore]:
+    """
+    The memory-mapped features of the dataset, None when it has none.
+    """
+    features_path = config["dataset"].get("features_path")
+    return read_feature_store(features_path) if features_path is not None else None
+
+
 def preprocess_dataset(dataset: List[dict], config: dict) -> List[dict]:
     """
     Preprocess the dataset. The resulting text field will become a list
     of tokens.
     """
-    # Get the preprocessing part of the config
+    # The sections selection, removal of patterns, lowercasing, splitting of
+    # the measures and tokenization, in a single pass over the dataset
     preprocessing_config = config["preprocessing"]
-    # Removal of patterns
-    patterns = [
-        re.compile(pattern) for pattern in preprocessing_config["patterns_to_remove"]
-    ]
-    dataset = remove_patterns_from_text(dataset, patterns)
-    # Lowercasing
-    if preprocessing_config["lowercase"]:
-        dataset = lowercase_dataset(dataset)
-    # Splitting of text that consists of measurements
-    if preprocessing_config["split_measure_text"]:
-        dataset = split_measure_text(dataset)
-    # Tokenization
-    dataset = tokenize_dataset(
-        dataset, tokenizer_type=preprocessing_config["tokenizer_type"]
+    pipeline = PreprocessingPipeline.from_config(preprocessing_config)
+    return pipeline.preprocess_dataset(
+        dataset, n_jobs=preprocessing_config.get("n_jobs", 1)
     )
-    return dataset
 
 
-def get_trained_classifier(train_set: dict, config: dict) -> Pipeline:
+def get_preprocessed_dataset_key(config: dict) -> Optional[str]:
     """
-    NOTE: The use of features is still uncertain.
+    Key of the preprocessed dataset in the caches, None when there is no cache.
+    It hashes the whole dataset, so it is made once per run and passed to
+    get_preprocessed_dataset and vectorize_sets.
     """
-    # Get the training part of the config
-    training_config = config["training"]
-    vectorizer_config = training_config["vectorizer"]
-    model_config = training_config["model"]
-    # Create vectorizer
-    vectorizer = create_vectorizer(
+    if (
+        config.get("preprocessing_cache") is None
+        and config.get("vectorization_cache") is None
+    ):
+        return None
+    return get_preprocessing_cache_key(config["dataset"], config["preprocessing"])
+
+
+def get_preprocessed_dataset(
+    config: dict, preprocessed_dataset_key: Optional[str] = None
+) -> Tuple[List[dict], Optional[TokenCorpus]]:
+    """
+    Read and preprocess the dataset, or load it from the preprocessing cache
+    when it was already preprocessed with the same preprocessing config. From
+    the cache, the records come without their texts, which are the returned
+    memory-mapped corpus (see get_train_and_test_set), None otherwise.
+    """
+    cache_config = config.get("preprocessing_cache")
+    if cache_config is None:
+        return preprocess_dataset(get_dataset(config), config), None
+    cache = PreprocessingCache(
+        cache_config["directory"], max_size_bytes=cache_config["max_size_mb"] << 20
+    )
+    cache_key = (
+        preprocessed_dataset_key
+        if preprocessed_dataset_key is not None
+        else get_preprocessed_dataset_key(config)
+    )
+    cached_dataset = cache.get(cache_key)
+    if cached_dataset is not None:
+        logger.info(f"Preprocessed dataset loaded from the cache ({cache_key})")
+        return cached_dataset
+    dataset = preprocess_dataset(get_dataset(config), config)
+    cache.put(cache_key, dataset)
+    return dataset, None
+
+
+def get_vectorizer(config: dict) -> Union["CountVectorizer", "TfidfVectorizer"]:
+    vectorizer_config = config["training"]["vectorizer"]
+    return create_vectorizer(
         vectorizer_type=vectorizer_config["vectorizer_type"],
         remove_stopwords=vectorizer_config["remove_stopwords"],
         ngram_range=vectorizer_config["ngram_range"],
         binary=vectorizer_config["binary"],
+        dtype=VECTORIZER_DTYPES.get(vectorizer_config["vectorizer_type"]),
     )
+
+
+def vectorize_sets(
+    train_set: dict,
+    test_set: dict,
+    config: dict,
+    preprocessed_dataset_key: Optional[str] = None,
+) -> Union["CountVectorizer", "TfidfVectorizer"]:
+    """
+    Fit the vectorizer on the train texts and add the document-term matrix of
+    the texts of each set to it ("matrix"). They are loaded from the
+    vectorization cache when the same texts were already vectorized with the
+    same vectorizer config, e.g. for another model. The key of the preprocessed
+    dataset is made when it is not given (see get_preprocessed_dataset_key).
+    """
+    vectorizer = get_vectorizer(config)
+    cache_config = config.get("vectorization_cache")
+    cache, cache_key, matrices = None, None, None
+    if cache_config is not None:
+        cache = VectorizationCache(
+            cache_config["directory"],
+            max_size_bytes=cache_config["max_size_mb"] << 20,
+        )
+        cache_key = get_vectorization_cache_key(
+            preprocessed_dataset_key
+            if preprocessed_dataset_key is not None
+            else get_preprocessed_dataset_key(config),
+            {"train_test_ratio_split": TRAIN_TEST_RATIO_SPLIT, "seed": RANDOM_SEED},
+            config["training"]["vectorizer"],
+        )
+        matrices = cache.get(cache_key)
+    if matrices is not None:
+        logger.info(f"Document-term matrices loaded from the cache ({cache_key})")
+        set_vectorizer_vocabulary(vectorizer, matrices.feature_names, matrices.idf)
+    else:
+        train_matrix = vectorizer.fit_transform(train_set["texts"])
+        matrices = DocumentTermMatrices(
+            feature_names=vectorizer.get_feature_names_out().tolist(),
+            idf=getattr(vectorizer, "idf_", None),
+            train_matrix=train_matrix,
+            test_matrix=vectorizer.transform(test_set["texts"]),
+        )
+        if cache is not None:
+            cache.put(cache_key, matrices)
+    train_set["matrix"] = matrices.train_matrix
+    test_set["matrix"] = matrices.test_matrix
+    return vectorizer
+
+
+def get_trained_classifier(
+    train_set: dict,
+    config: dict,
+    vectorizer: Optional[Union["CountVectorizer", "TfidfVectorizer"]] = None,
+) -> "Pipeline":
+    """
+    With a vectorizer fitted by vectorize_sets, only the model is fitted, on
+    the document-term matrix of the train set.
+    NOTE: The use of features is still uncertain.
+    """
+    # Get the training part of the config
+    model_config = config["training"]["model"]
     # Create model
     model = create_model(
         model_type=model_config["model_type"], **model_config["model_params"]
     )
+    if vectorizer is not None:
+        model.fit(train_set["matrix"], train_set["labels"])
+        return create_classifier(vectorizer, model)
     # Create classifier
-    classifier = create_classifier(vectorizer, model)
+    classifier = create_classifier(get_vectorizer(config), model)
     # Fit classifier
     train_classifier(
         classifier, X_train=train_set["texts"], y_train=train_set["labels"]
@@ -105,17 +219,23 @@ def get_trained_classifier(train_set: dict, config: dict) -> Pipeline:
 
 
 def log_results(
-    classifier: Pipeline, test_set: dict, project_name: str, config_path: Path
+    classifier: "Pipeline", test_set: dict, project_name: str, config_path: Path
 ) -> None:
     # TODO: Make directory for each run with logs and model saves (for later when using torch
     # and doing hp search)
+    import wandb
+
     # Log to wandb
     wandb.init(project=project_name, entity=WANDB_ENTITY_NAME)
     # Save the config path
     wandb.save(str(config_path), policy="end")
     # Get the test set predictions
     y_true = test_set["labels"]
-    y_pred = classifier.predict(test_set["texts"])
+    y_pred = (
+        classifier.named_steps["model"].predict(test_set["matrix"])
+        if "matrix" in test_set
+        else classifier.predict(test_set["texts"])
+    )
     # Classification report
     classification_report_visualization = get_classification_report_visualization(
         y_true=y_true, y_pred=y_pred
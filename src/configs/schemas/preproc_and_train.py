@@ -1,18 +1,51 @@
-from schema import Schema, Optional
+from schema import Schema, Optional, Or
 
 
 config_schema = Schema(
     {
         "schema": "preproc_and_train",
         "dataset": {
+            # A .jsonl file, possibly compressed (.jsonl.gz, .jsonl.zst),
+            # or a pattern of shards, e.g. dataset-*.jsonl.gz
             "path": str,
+            # .npy features file written by src.utils.features.write_feature_store
+            Optional("features_path", default=None): Or(None, str),
+            # Number of records drawn at random from the dataset, e.g. to debug
+            Optional("n_samples", default=None): Or(None, int),
         },
         "preprocessing": {
+            # Sections of the report to keep, e.g. [impression], all by default
+            Optional("sections", default=None): Or(None, list),
             "patterns_to_remove": list,
             "lowercase": bool,
             "split_measure_text": bool,
             "tokenizer_type": str,
+            # Number of processes which preprocess the dataset
+            Optional("n_jobs", default=1): int,
         },
+        # On-disk cache of the preprocessed dataset, keyed by the dataset content
+        # and the preprocessing block, so that only the training block can change
+        # between runs without preprocessing again. No cache when null.
+        Optional("preprocessing_cache", default=None): Or(
+            None,
+            {
+                "directory": str,
+                # The least recently used entries are removed above this size
+                Optional("max_size_mb", default=2048): int,
+            },
+        ),
+        # On-disk cache of the fitted vocabulary and the train and test
+        # document-term matrices, keyed by the preprocessed dataset, the split
+        # and the vectorizer block, so that the texts are vectorized once for
+        # all the models. No cache when null.
+        Optional("vectorization_cache", default=None): Or(
+            None,
+            {
+                "directory": str,
+                # The least recently used entries are removed above this size
+                Optional("max_size_mb", default=2048): int,
+            },
+        ),
         "training": {
             "vectorizer": {
                 "vectorizer_type": str,
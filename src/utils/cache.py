@@ -0,0 +1,87 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+
+def get_directory_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+
+
+class DirectoryCache:
+    """
+    On-disk cache whose entries are directories named after their keys. When
+    the entries take more than max_size_bytes, the least recently used ones
+    are removed.
+    """
+
+    def __init__(self, cache_directory: Path, max_size_bytes: int):
+        assert (
+            max_size_bytes > 0
+        ), f"The size of the cache should be positive, got {max_size_bytes}"
+        self.cache_directory = Path(cache_directory)
+        self.max_size_bytes = max_size_bytes
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+
+    def get_entry_directory(self, key: str) -> Path:
+        return self.cache_directory / key
+
+    def use_entry(self, key: str) -> Optional[Path]:
+        """
+        Directory of the entry of the key, None when it is not in the cache.
+        """
+        entry_directory = self.get_entry_directory(key)
+        if not entry_directory.is_dir():
+            return None
+        # The modification time of the entry is its last use, for the eviction
+        os.utime(entry_directory)
+        return entry_directory
+
+    def add_entry(self, key: str, write_entry: Callable[[Path], None]) -> None:
+        """
+        Write the entry of the key with write_entry(directory) and evict the
+        least recently used entries if the cache is too big.
+        """
+        entry_directory = self.get_entry_directory(key)
+        if entry_directory.is_dir():
+            return
+        # Written aside then renamed so that an entry is never seen half-written
+        tmp_directory = self.cache_directory / f".{key}.{os.getpid()}.tmp"
+        tmp_directory.mkdir(parents=True, exist_ok=True)
+        write_entry(tmp_directory)
+        try:
+            os.rename(tmp_directory, entry_directory)
+        except OSError:
+            # Another run has just written the same entry
+            shutil.rmtree(tmp_directory)
+        self.evict(keep_key=key)
+
+    def get_entries(self) -> List[Tuple[Path, int]]:
+        """
+        Directory and size of the entries, the least recently used first.
+        """
+        entry_directories = [
+            path
+            for path in self.cache_directory.iterdir()
+            if path.is_dir() and not path.name.startswith(".")
+        ]
+        entry_directories.sort(key=lambda path: path.stat().st_mtime_ns)
+        return [(path, get_directory_size(path)) for path in entry_directories]
+
+    def evict(self, keep_key: Optional[str] = None) -> List[str]:
+        """
+        Remove the least recently used entries (other than keep_key) until the
+        cache takes at most max_size_bytes. Returns the keys of those entries.
+        """
+        entries = self.get_entries()
+        cache_size = sum(size for _, size in entries)
+        evicted_keys = []
+        for entry_directory, size in entries:
+            if cache_size <= self.max_size_bytes:
+                break
+            if entry_directory.name == keep_key:
+                continue
+            shutil.rmtree(entry_directory)
+            cache_size -= size
+            evicted_keys.append(entry_directory.name)
+        return evicted_keys
@@ -0,0 +1,97 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+# Tokenized texts, one list of tokens per text, e.g. after tokenize_dataset
+TokenizedTexts = List[List[str]]
+
+
+class TokenCorpus:
+    """
+    Tokenized texts stored once, as int32 ids into a shared vocabulary in a
+    single flat array, text i being token_ids[offsets[i]:offsets[i + 1]].
+    A corpus is a view on some of the texts (documents, all by default):
+    indexing it with an index array, a mask or a slice gives another view
+    on the same arrays, without copying the tokens. It can be used in place
+    of a list of tokenized texts, which are then decoded one at a time.
+    """
+
+    def __init__(
+        self,
+        vocabulary: List[str],
+        token_ids: npt.NDArray[np.int32],
+        offsets: npt.NDArray[np.int64],
+        documents: Optional[npt.NDArray[np.int64]] = None,
+    ):
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.documents = (
+            documents if documents is not None else np.arange(len(offsets) - 1)
+        )
+
+    @classmethod
+    def from_texts(cls, texts: TokenizedTexts) -> "TokenCorpus":
+        token_to_id: Dict[str, int] = {}
+        token_ids = []
+        offsets = [0]
+        for text in texts:
+            assert isinstance(
+                text, list
+            ), f"The texts should be lists of tokens, got {type(text).__name__}"
+            token_ids.extend(
+                token_to_id.setdefault(token, len(token_to_id)) for token in text
+            )
+            offsets.append(len(token_ids))
+        return cls(
+            vocabulary=list(token_to_id),
+            token_ids=np.array(token_ids, dtype=np.int32),
+            offsets=np.array(offsets, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __getitem__(
+        self, index: Union[int, slice, npt.ArrayLike]
+    ) -> Union[List[str], "TokenCorpus"]:
+        """
+        The tokens of a text for an integer, a view on the texts otherwise.
+        """
+        if isinstance(index, (int, np.integer)):
+            return self.decode(self.get_token_ids(self.documents[index]))
+        return TokenCorpus(
+            self.vocabulary, self.token_ids, self.offsets, self.documents[index]
+        )
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for document in self.documents:
+            yield self.decode(self.get_token_ids(document))
+
+    def get_token_ids(self, document: int) -> npt.NDArray[np.int32]:
+        return self.token_ids[self.offsets[document] : self.offsets[document + 1]]
+
+    def decode(self, token_ids: npt.NDArray[np.int32]) -> List[str]:
+        return [self.vocabulary[token_id] for token_id in token_ids.tolist()]
+
+    def get_flat_token_ids(
+        self,
+    ) -> Tuple[npt.NDArray[np.int32], npt.NDArray[np.int64]]:
+        """
+        The token ids of the texts of the view, one text after the other, and
+        the text of each token (its position in the view).
+        """
+        starts = self.offsets[self.documents]
+        lengths = self.offsets[self.documents + 1] - starts
+        # Shift the positions of the tokens of each text to where it starts
+        positions = np.arange(lengths.sum(), dtype=np.int64)
+        positions += np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.token_ids[positions], np.repeat(
+            np.arange(len(self), dtype=np.int64), lengths
+        )
+
+    def iter_batches(self, batch_size: int) -> Iterator["TokenCorpus"]:
+        assert batch_size >= 1, f"The batch size should be at least 1, got {batch_size}"
+        for start in range(0, len(self), batch_size):
+            yield self[start : start + batch_size]
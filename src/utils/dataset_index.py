@@ -0,0 +1,175 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+from src.utils.json import (
+    JSON_BACKEND,
+    get_json_loads,
+    get_shard_file_paths,
+    is_compressed,
+    iter_jsonlines,
+)
+
+# Sidecar files of a dataset.jsonl file: the byte offsets of its records
+# (dataset.jsonl.offsets.npy, memory-mapped) and their ids (dataset.jsonl.ids.json)
+OFFSETS_SUFFIX = ".offsets.npy"
+IDS_SUFFIX = ".ids.json"
+
+
+def get_index_file_paths(file_path: Path) -> Tuple[Path, Path]:
+    file_path = Path(file_path)
+    return (
+        file_path.with_name(file_path.name + OFFSETS_SUFFIX),
+        file_path.with_name(file_path.name + IDS_SUFFIX),
+    )
+
+
+def get_file_signature(file_path: Path) -> dict:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class JsonlinesIndex:
+    """
+    Random access to the records of a jsonlines file, by position or by id,
+    through the byte offsets of its lines. Only the records which are read
+    are decoded.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        offsets: npt.NDArray[np.int64],
+        ids: Optional[List[str]],
+        backend: str = JSON_BACKEND,
+    ):
+        self.file_path = Path(file_path)
+        # offsets[i]:offsets[i + 1] are the bytes of the record i
+        self.offsets = offsets
+        self.ids = ids
+        self.loads = get_json_loads(backend)
+        self._id_to_position = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def id_to_position(self) -> Dict[str, int]:
+        assert self.ids is not None, "The index was built without ids."
+        if self._id_to_position is None:
+            self._id_to_position = {id_: i for i, id_ in enumerate(self.ids)}
+        return self._id_to_position
+
+    def iter_records(self, positions: npt.ArrayLike) -> Iterator[dict]:
+        """
+        Read the records at these positions, in the given order.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        with open(self.file_path, "rb") as f:
+            for position in positions:
+                assert (
+                    0 <= position < len(self)
+                ), f"Position {position} out of range for {len(self)} records"
+                start, end = self.offsets[position], self.offsets[position + 1]
+                f.seek(start)
+                yield self.loads(f.read(end - start))
+
+    def read_records(self, positions: npt.ArrayLike) -> List[dict]:
+        return list(self.iter_records(positions))
+
+    def read_records_by_id(self, ids: List[str]) -> List[dict]:
+        return self.read_records([self.id_to_position[id_] for id_ in ids])
+
+    def sample_records(self, n_records: int, seed: int = 42) -> List[dict]:
+        """
+        n_records records drawn at random, in the order of the file.
+        """
+        n_records = min(n_records, len(self))
+        rng = np.random.default_rng(seed)
+        positions = np.sort(rng.choice(len(self), size=n_records, replace=False))
+        return self.read_records(positions)
+
+
+def build_jsonlines_index(
+    file_path: Path, id_field: Optional[str] = "id", backend: str = JSON_BACKEND
+) -> JsonlinesIndex:
+    """
+    Go once through the jsonlines file to write its sidecar offsets and ids.
+    The blank lines are left out of the records, like iter_jsonlines does.
+    """
+    assert not is_compressed(
+        file_path
+    ), f"Records cannot be read at an offset of a compressed file, {file_path}"
+    offsets_path, ids_path = get_index_file_paths(file_path)
+    loads = get_json_loads(backend)
+    offsets = []
+    ids = [] if id_field is not None else None
+    offset = 0
+    with open(file_path, "rb") as f:
+        for line in f:
+            if not line.isspace():
+                offsets.append(offset)
+                if id_field is not None:
+                    ids.append(loads(line)[id_field])
+            offset += len(line)
+    # The end of the last record, which is also where the next one would start
+    offsets.append(offset)
+    np.save(offsets_path, np.array(offsets, dtype=np.int64))
+    with open(ids_path, "w") as f:
+        json.dump(
+            {"ids": ids, "id_field": id_field, **get_file_signature(file_path)}, f
+        )
+    return JsonlinesIndex(file_path, np.load(offsets_path, mmap_mode="r"), ids, backend)
+
+
+def get_jsonlines_index(
+    file_path: Path, id_field: Optional[str] = "id", backend: str = JSON_BACKEND
+) -> JsonlinesIndex:
+    """
+    Memory-map the index of the jsonlines file, which is built first when it
+    does not exist or when the file has changed since it was built.
+    """
+    offsets_path, ids_path = get_index_file_paths(file_path)
+    if offsets_path.exists() and ids_path.exists():
+        with open(ids_path, "r") as f:
+            ids_index = json.load(f)
+        file_signature = get_file_signature(file_path)
+        if ids_index["id_field"] == id_field and all(
+            ids_index[key] == value for key, value in file_signature.items()
+        ):
+            offsets = np.load(offsets_path, mmap_mode="r")
+            return JsonlinesIndex(file_path, offsets, ids_index["ids"], backend)
+    return build_jsonlines_index(file_path, id_field=id_field, backend=backend)
+
+
+def sample_jsonlines(
+    file_path: Union[Path, str],
+    n_records: int,
+    seed: int = 42,
+    backend: str = JSON_BACKEND,
+) -> List[dict]:
+    """
+    n_records records of the dataset drawn at random, in the order of the file.
+    Only the sampled records of a plain jsonlines file are read, through its
+    index. A compressed file or a sharded dataset has no offsets to seek to, so
+    its records are streamed once and sampled with a reservoir.
+    """
+    shard_file_paths = get_shard_file_paths(file_path)
+    if len(shard_file_paths) == 1 and not is_compressed(shard_file_paths[0]):
+        dataset_index = get_jsonlines_index(shard_file_paths[0], backend=backend)
+        return dataset_index.sample_records(n_records, seed=seed)
+    rng = np.random.default_rng(seed)
+    # (position, record) of the sampled records
+    reservoir = []
+    for position, record in enumerate(iter_jsonlines(file_path, backend=backend)):
+        if position < n_records:
+            reservoir.append((position, record))
+            continue
+        replaced_index = rng.integers(position + 1)
+        if replaced_index < n_records:
+            reservoir[replaced_index] = (position, record)
+    reservoir.sort(key=lambda sample: sample[0])
+    return [record for _, record in reservoir]
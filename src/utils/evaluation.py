@@ -1,14 +1,17 @@
+from typing import TYPE_CHECKING
+
 import numpy as np
 import numpy.typing as npt
-from sklearn.metrics import confusion_matrix
-from sklearn.pipeline import Pipeline
 from src import LOG_CONFIG_PATH
 from src.utils.logging import get_logger
 
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
 logger = get_logger(log_config_path=LOG_CONFIG_PATH, diplayed_logger_name=__file__)
 
 
-def get_prediction(classifier: Pipeline, dataset: dict) -> npt.NDArray[np.int64]:
+def get_prediction(classifier: "Pipeline", dataset: dict) -> npt.NDArray[np.int64]:
     """
     Get the prediction for the classifier on the dataset.
     """
@@ -22,4 +25,6 @@ def get_confusion_matrix(
     """
     Get the confusion matrix for the set of true and predict labels.
     """
+    from sklearn.metrics import confusion_matrix
+
     return confusion_matrix(y_true=y_true, y_pred=y_pred)
@@ -0,0 +1,107 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# The features of the reports are stored as one .npy matrix, one row per report,
+# next to an index of the report ids (and feature names) in the same order
+FEATURE_INDEX_SUFFIX = ".index.json"
+DEFAULT_FEATURE_DTYPE = np.float32
+
+
+class FeatureStore(NamedTuple):
+    # Memory-mapped (n_reports, n_features) matrix
+    matrix: npt.NDArray
+    ids: List[str]
+    feature_names: Optional[List[str]]
+    id_to_row: Dict[str, int]
+
+    def get_rows(self, ids: List[str]) -> npt.NDArray[np.int64]:
+        """
+        Row index of each id, -1 for the ids without features.
+        """
+        return np.array([self.id_to_row.get(id_, -1) for id_ in ids], dtype=np.int64)
+
+
+def get_feature_index_path(features_file_path: Path) -> Path:
+    return Path(features_file_path).with_suffix(FEATURE_INDEX_SUFFIX)
+
+
+def write_feature_store(
+    features_file_path: Path,
+    ids: List[str],
+    matrix: npt.ArrayLike,
+    feature_names: Optional[List[str]] = None,
+    dtype: npt.DTypeLike = DEFAULT_FEATURE_DTYPE,
+) -> None:
+    """
+    Write the (n_reports, n_features) matrix as a .npy file and the ids of its
+    rows (and the names of its columns) as a .index.json file next to it.
+    """
+    features_file_path = Path(features_file_path)
+    assert (
+        features_file_path.suffix == ".npy"
+    ), f"The features file should be a .npy file, {features_file_path.suffix}"
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    assert matrix.ndim == 2, f"The features should be a matrix, got {matrix.ndim} dims"
+    assert matrix.shape[0] == len(
+        ids
+    ), f"{matrix.shape[0]} rows of features for {len(ids)} ids"
+    assert len(set(ids)) == len(ids), "The ids of the features should be unique."
+    assert (
+        feature_names is None or len(feature_names) == matrix.shape[1]
+    ), "There should be one feature name per column of the features."
+    np.save(features_file_path, matrix)
+    feature_index_path = get_feature_index_path(features_file_path)
+    with open(feature_index_path, "w") as f:
+        json.dump({"ids": list(ids), "feature_names": feature_names}, f)
+
+
+def read_feature_store(features_file_path: Path, mmap: bool = True) -> FeatureStore:
+    """
+    Read a feature store written by write_feature_store. With mmap, the matrix
+    is memory-mapped read-only rather than loaded, so only the rows which are
+    used are read from disk.
+    """
+    features_file_path = Path(features_file_path)
+    feature_index_path = get_feature_index_path(features_file_path)
+    assert features_file_path.exists() and os.path.exists(
+        feature_index_path
+    ), f"The features file {features_file_path} or its index does not exist."
+    matrix = np.load(features_file_path, mmap_mode="r" if mmap else None)
+    with open(feature_index_path, "r") as f:
+        feature_index = json.load(f)
+    ids = feature_index["ids"]
+    assert matrix.ndim == 2 and matrix.shape[0] == len(
+        ids
+    ), f"The features matrix {matrix.shape} does not match its {len(ids)} ids"
+    return FeatureStore(
+        matrix=matrix,
+        ids=ids,
+        feature_names=feature_index["feature_names"],
+        id_to_row={id_: row for row, id_ in enumerate(ids)},
+    )
+
+
+def get_feature_rows(
+    feature_store: FeatureStore, rows: npt.ArrayLike, fill_value: float = np.nan
+) -> npt.NDArray:
+    """
+    Contiguous copy of the given rows of the store, in the given order. The
+    reports without features (row -1) get a row of fill_value, so that they
+    can be told apart (e.g. with np.isnan) rather than dropped.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    has_features = rows >= 0
+    if np.all(has_features):
+        return np.ascontiguousarray(feature_store.matrix[rows])
+    features = np.full(
+        (len(rows), feature_store.matrix.shape[1]),
+        fill_value,
+        dtype=np.result_type(feature_store.matrix.dtype, np.float32),
+    )
+    features[has_features] = feature_store.matrix[rows[has_features]]
+    return features
@@ -1,20 +1,220 @@
-import jsonlines
+import glob
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
-from typing import List
+from typing import IO, Any, Callable, Iterable, Iterator, List, Optional, Union
 
+# orjson is used to decode and encode the lines when it is installed, it is
+# several times faster than the json module on our datasets
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def read_jsonlines(file_path: Path) -> List[dict]:
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+# Compressed jsonlines files are recognised by their extension
+GZIP_SUFFIX = ".gz"
+ZSTD_SUFFIX = ".zst"
+JSONLINES_SUFFIXES = [".jsonl", ".jsonl" + GZIP_SUFFIX, ".jsonl" + ZSTD_SUFFIX]
+# Suffix of the files written with each compression
+COMPRESSION_SUFFIXES = {"none": "", "gzip": GZIP_SUFFIX, "zstd": ZSTD_SUFFIX}
+# Characters which make a dataset path a pattern of shards, e.g. dataset-*.jsonl.gz
+SHARD_PATTERN_CHARACTERS = "*?["
+# Number of records encoded before they are written to the file at once
+DEFAULT_WRITE_BUFFER_SIZE = 1024
+
+
+def get_json_loads(backend: str = JSON_BACKEND) -> Callable[[bytes], Any]:
+    if backend == "orjson":
+        assert orjson is not None, "orjson is not installed."
+        return orjson.loads
+    elif backend == "json":
+        return json.loads
+    else:
+        raise ValueError(f"Unknown json backend {backend}.")
+
+
+def get_json_dumps(backend: str = JSON_BACKEND) -> Callable[[Any], bytes]:
+    if backend == "orjson":
+        assert orjson is not None, "orjson is not installed."
+        return orjson.dumps
+    elif backend == "json":
+        # Same format as the jsonlines package
+        encoder = json.JSONEncoder(ensure_ascii=False)
+        return lambda obj: encoder.encode(obj).encode("utf-8")
+    else:
+        raise ValueError(f"Unknown json backend {backend}.")
+
+
+def open_jsonlines_file(file_path: Path, mode: str = "rb") -> IO[bytes]:
+    """
+    Open a jsonlines file in binary mode, through gzip or zstandard when it
+    is compressed (.gz or .zst).
+    """
+    suffix = Path(file_path).suffix
+    if suffix == GZIP_SUFFIX:
+        return gzip.open(file_path, mode)
+    elif suffix == ZSTD_SUFFIX:
+        assert zstandard is not None, f"zstandard is needed to open {file_path}"
+        if "r" in mode:
+            # The zstandard reader cannot be iterated line by line on its own
+            return io.BufferedReader(zstandard.open(file_path, mode))
+        return zstandard.open(file_path, mode)
+    else:
+        return open(file_path, mode)
+
+
+def is_compressed(file_path: Path) -> bool:
+    return Path(file_path).suffix in [GZIP_SUFFIX, ZSTD_SUFFIX]
+
+
+def is_jsonlines_file_path(file_path: Path) -> bool:
+    return any(str(file_path).endswith(suffix) for suffix in JSONLINES_SUFFIXES)
+
+
+def get_shard_file_paths(file_path: Union[Path, str]) -> List[Path]:
+    """
+    The files of a dataset: the file itself or, when its path is a pattern
+    (e.g. dataset-*.jsonl.gz), the shards which match it in sorted order. An
+    existing file is never globbed, even if its name has pattern characters
+    (e.g. reports[2023].jsonl).
+    """
+    if Path(file_path).exists() or not any(
+        character in str(file_path) for character in SHARD_PATTERN_CHARACTERS
+    ):
+        return [Path(file_path)]
+    shard_file_paths = [Path(path) for path in sorted(glob.glob(str(file_path)))]
+    assert len(shard_file_paths) > 0, f"No dataset shards match {file_path}"
+    return shard_file_paths
+
+
+def iter_jsonlines(
+    file_path: Path,
+    fields: Optional[List[str]] = None,
+    backend: str = JSON_BACKEND,
+) -> Iterator[dict]:
+    """
+    Lazily reads a jsonlines file, one dictionary at a time. With fields,
+    only these fields of each line are kept (e.g. ["id", "label"]) so that
+    the other ones (e.g. the text) are freed as soon as the line is decoded.
+    The file can be compressed and its path can be a pattern of shards,
+    which are read one after the other.
     """
-    Reads a jsonlines file and returns a list of dictionaries.
+    shard_file_paths = get_shard_file_paths(file_path)
+    if len(shard_file_paths) > 1:
+        yield from chain.from_iterable(
+            iter_jsonlines(path, fields=fields, backend=backend)
+            for path in shard_file_paths
+        )
+        return
+    loads = get_json_loads(backend)
+    with open_jsonlines_file(shard_file_paths[0], "rb") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.isspace():
+                continue
+            try:
+                obj = loads(line)
+            except ValueError as e:
+                raise ValueError(
+                    f"Invalid json on line {line_number} of {file_path}: {e}"
+                ) from e
+            if fields is not None:
+                obj = {field: obj[field] for field in fields if field in obj}
+            yield obj
+
+
+def read_jsonlines(
+    file_path: Path,
+    fields: Optional[List[str]] = None,
+    backend: str = JSON_BACKEND,
+    workers: Optional[int] = None,
+) -> List[dict]:
+    """
+    Reads a jsonlines file and returns a list of dictionaries. When the path
+    is a pattern of shards, the shards are read by a pool of threads (in which
+    the reads and decompression overlap) and concatenated in sorted order.
+    """
+    shard_file_paths = get_shard_file_paths(file_path)
+    if len(shard_file_paths) == 1:
+        return list(iter_jsonlines(file_path, fields=fields, backend=backend))
+    workers = (
+        workers if workers is not None else min(len(shard_file_paths), os.cpu_count())
+    )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        shards = executor.map(
+            lambda path: list(iter_jsonlines(path, fields=fields, backend=backend)),
+            shard_file_paths,
+        )
+        return list(chain.from_iterable(shards))
+
+
+class JsonlinesWriter:
     """
-    with jsonlines.open(file_path) as reader:
-        return [line for line in reader]
+    Buffered jsonlines writer: the lines are encoded as they are written but
+    only written to the file buffer_size lines at a time, in a single call.
+    The remaining lines are written when the writer is closed. The file is
+    compressed when its name ends with .gz or .zst.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        mode: str = "w",
+        buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+        backend: str = JSON_BACKEND,
+    ):
+        assert mode in ["w", "a"], f"The mode should be w or a, got {mode}"
+        assert (
+            buffer_size >= 1
+        ), f"The buffer size should be at least 1, got {buffer_size}"
+        self.file = open_jsonlines_file(file_path, mode + "b")
+        self.buffer_size = buffer_size
+        self.dumps = get_json_dumps(backend)
+        self.buffer = []
+
+    def write(self, obj: dict) -> None:
+        self.buffer.append(self.dumps(obj))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, objs: Iterable[dict]) -> None:
+        for obj in objs:
+            self.write(obj)
+
+    def flush(self) -> None:
+        if len(self.buffer) > 0:
+            self.file.write(b"\n".join(self.buffer) + b"\n")
+            self.buffer = []
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self) -> "JsonlinesWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
-def write_jsonlines(data: List[dict], file_path: Path, mode: str = "w") -> None:
+def write_jsonlines(
+    data: Iterable[dict],
+    file_path: Path,
+    mode: str = "w",
+    buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+) -> None:
     """
-    Writes a list of dictionaries to a jsonlines file.
+    Writes a list (or any iterable) of dictionaries to a jsonlines file.
     """
-    with jsonlines.open(file_path, mode=mode) as writer:
-        for line in data:
-            writer.write(line)
+    with JsonlinesWriter(file_path, mode=mode, buffer_size=buffer_size) as writer:
+        writer.write_all(data)
@@ -1,10 +1,105 @@
 import re
-from typing import List, Pattern
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, List, Optional, Pattern, Union
 
-from nltk.tokenize import word_tokenize
-from nltk.tokenize.stanford import StanfordTokenizer
 from src import REPO_DIRECTORY
 from src.utils.json import read_jsonlines
+from src.utils.text_extraction import ReportSegmenter
+
+# Substitutions of split_measure_text, applied in this order
+MEASURE_SPLITS = [
+    # 11.2x12.3x13.4cm -> 11.2 x 12.3 x 13.4cm
+    (re.compile(r"(\d+\.\d)x(\d+\.\d)x(\d+\.\d)"), r"\1 x \2 x \3"),
+    # 11.2x12.3cm -> 11.2 x 12.3cm
+    (re.compile(r"(\d+\.\d)x(\d+\.\d)"), r"\1 x \2"),
+    # 11.2mm -> 11.2 mm
+    (re.compile(r"(\d+\.\d)([cm]m)"), r"\1 \2"),
+    # 11mm -> 11 mm
+    (re.compile(r"(\d+)([cm]m)"), r"\1 \2"),
+]
+# Every match of the measure splits starts with a digit and is made of these
+# characters, so it is always inside one such run, which starts at a digit
+MEASURE_RUN_PATTERN = re.compile(r"\d[\d.xcm]*")
+# The same measures come back in many reports
+MAX_CACHED_MEASURE_RUNS = 65536
+# Characters which are always tokens on their own with word_tokenize
+SPLIT_CHARACTERS = r"?!;@#$%&*()\[\]{}<>«»“”‘’„\u2012-\u2015"
+# Period which ends a sentence, e.g. "3 mm. The", "(3 mm.)" or "3 mm.:"
+SENTENCE_END_PERIOD = r"""(?<!\.)\.(?=['")\]}>]*(?:\s|$)|[?!")\];}*:@'({\[])"""
+# Lookahead for the end of a token: a space or a token which is split off
+TOKEN_END = (
+    rf"""(?=\s|$|[{SPLIT_CHARACTERS}`"]|[:,](?!\d)|\.\.|--|{SENTENCE_END_PERIOD})"""
+)
+# Abbreviations of the English punkt model, whose period does not end the
+# sentence (the model has many more, these are those found in reports)
+ABBREVIATIONS = ["dr", "e.g", "i.e", "mr", "mrs", "vs"]
+# Lowercase letters (re has no \p{Ll}), enough for English and French reports
+LOWERCASE_LETTERS = "a-zß-öø-ÿœ"
+# Period which punkt does not see as the end of a sentence, and which word_tokenize
+# leaves on its token: after an abbreviation, and after a number (e.g. 1. or
+# 3.5.) or a single letter before a lowercase word or a , ; : ! ?, e.g. the
+# periods of "1. normal liver 2. small kidney."
+KEPT_PERIOD_TOKEN = rf"""
+    (?<![^\s{SPLIT_CHARACTERS}"])
+    (?:
+        (?:-?\d[\d,.-]*|[^\W\d_])(?<!\.)\.(?=\s+[{LOWERCASE_LETTERS};:,!?])
+        |(?i:{"|".join(re.escape(abbreviation) for abbreviation in ABBREVIATIONS)})
+        \.(?=\s+\S)
+    )
+"""
+# Words which word_tokenize splits in two
+SPLIT_WORDS = [
+    ("can", "not"),
+    ("d", "'ye"),
+    ("gim", "me"),
+    ("gon", "na"),
+    ("got", "ta"),
+    ("lem", "me"),
+    ("more", "'n"),
+    ("wan", "na"),
+]
+SPLIT_WORDS_PATTERN = "|".join(
+    rf"\b{start}(?={end}\b)|(?<=\b{start}){end}\b" for start, end in SPLIT_WORDS
+)
+# Endings of English contractions, e.g. it 's, does n't, which are tokens
+QUOTE_CONTRACTION_ENDING = r"(?:[sSmMdD]|ll|LL|re|RE|ve|VE)"
+CONTRACTION_ENDING = rf"(?:n't|N'T|'{QUOTE_CONTRACTION_ENDING}?)"
+# Tokens of the fast tokenizer, which are those of word_tokenize on report text
+# (sentences which end with a period followed by a space) found by a single
+# regex rather than the sentence splitting and the ~30 treebank substitutions
+FAST_TOKEN_PATTERN = re.compile(
+    rf"""
+    # Numbers, letters and abbreviations which keep their period
+    {KEPT_PERIOD_TOKEN}
+    # Most tokens are words and numbers, which are found first (unless they are
+    # split in two, the second part being the only token which follows a letter)
+    |(?<!\w)(?!(?i:{"|".join(start + end for start, end in SPLIT_WORDS)})\b)
+    \w+(?:[.-]\w+|[:,]\d\w*)*{TOKEN_END}
+    |\.{{2,}}|--|``|''|`+|[{SPLIT_CHARACTERS}]
+    # , and : unless they are followed by a digit, e.g. 1,5 or 10:30
+    |[:,](?!\d)
+    |{SENTENCE_END_PERIOD}
+    # Words split in two, e.g. can not
+    |(?i:{SPLIT_WORDS_PATTERN})
+    # Contraction endings and closing quote
+    |{CONTRACTION_ENDING}{TOKEN_END}
+    # Opening quote, e.g. 'normal
+    |(?<!\w)'(?!(?i:re|ve|ll|m|t|s|d|n)\b)(?=\w)
+    # Anything else is kept together up to a split token, e.g. l'utérus, +/-
+    |(?:
+        [^\s{SPLIT_CHARACTERS}`'":,.\-nN]+
+        |n(?!'t{TOKEN_END})|N(?!'T{TOKEN_END})
+        |'(?!'|{QUOTE_CONTRACTION_ENDING}?{TOKEN_END})
+        |[:,](?=\d)|-(?!-)|(?!{SENTENCE_END_PERIOD})\.(?!\.)
+    )+
+    """,
+    re.VERBOSE,
+)
+# Double quotes are replaced by `` when they open a quote and '' otherwise, ''
+# only opens a quote after a space or a bracket, as with the treebank tokenizer
+OPENING_DOUBLE_QUOTE_PATTERN = re.compile(r"""(?:^|(?<=[ (\[{<]))"|(?<=[ (\[{<])''""")
 
 
 def remove_patterns_from_text(
@@ -25,26 +120,46 @@ def remove_patterns_from_text(
     return dataset
 
 
+def select_report_sections(
+    dataset: List[dict],
+    section_names: List[str],
+    segmenter: Optional[ReportSegmenter] = None,
+) -> List[dict]:
+    """
+    Keep only the content of the given sections (e.g. ["impression"]) in the
+    text component of the dataset, in the order they appear in the report.
+    The section headers are dropped along the way, so the header patterns
+    do not need to be removed afterwards.
+    """
+    segmenter = segmenter if segmenter is not None else ReportSegmenter()
+    unknown_section_names = set(section_names) - set(segmenter.section_names)
+    assert (
+        len(unknown_section_names) == 0
+    ), f"Unknown sections {unknown_section_names}, expected some of {segmenter.section_names}"
+    section_names = set(section_names)
+    for elt in dataset:
+        elt["text"] = get_sections_text(segmenter, elt["text"], section_names)
+    return dataset
+
+
+def get_sections_text(segmenter: ReportSegmenter, text: str, section_names: set) -> str:
+    report = segmenter.segment(text)
+    return "".join(
+        report.text[start:end]
+        for section in report.sections
+        if section.name in section_names
+        for start, end in section.spans
+    )
+
+
 def split_measure_text(dataset: List[dict]) -> List[dict]:
     """
     Convert the measures into individual words e.g. 11.2mm -> 11.2 mm
     and 11.2x13.2cm -> 11.2 x 13.2 cm
     """
-    # Split all measures that look like 11.2x12.3cm into 11.2 x 12.3cm
-    # and all measures that loop like 11.2x12.3x13.4cm into 11.2 x 12.3 x 13.4cm
     for elt in dataset:
-        elt["text"] = re.sub(
-            r"(\d+\.\d)x(\d+\.\d)x(\d+\.\d)", r"\1 x \2 x \3", elt["text"]
-        )
-        elt["text"] = re.sub(r"(\d+\.\d)x(\d+\.\d)", r"\1 x \2", elt["text"])
-
-    # Split all measure that look like 11.2mm into 11.2 mm
-    for elt in dataset:
-        # Decimal numbers
-        elt["text"] = re.sub(r"(\d+\.\d)([cm]m)", r"\1 \2", elt["text"])
-        # Whole number
-        elt["text"] = re.sub(r"(\d+)([cm]m)", r"\1 \2", elt["text"])
-
+        for pattern, replacement in MEASURE_SPLITS:
+            elt["text"] = re.sub(pattern, replacement, elt["text"])
     return dataset
 
 
@@ -66,20 +181,186 @@ def tokenize_dataset(dataset: List[dict], tokenizer_type: str) -> List[dict]:
     - Neural models like BERT will require their own tokenizer
     from huggingface.
     """
+    tokenize = get_tokenizer(tokenizer_type)
     for elt in dataset:
-        if tokenizer_type == "nltk":
-            elt["text"] = word_tokenize(elt["text"])
-        elif tokenizer_type == "standford":
-            elt["text"] = StanfordTokenizer().tokenize(elt["text"])
-        else:
-            raise ValueError(f"Unknown tokenizer type {tokenizer_type}.")
+        elt["text"] = tokenize(elt["text"])
     return dataset
 
 
-dataset_path = (
+def fast_tokenize(text: str) -> List[str]:
+    """
+    Same tokens as word_tokenize on report text, several times faster. The
+    sentence ends are found without the punkt model, see KEPT_PERIOD_TOKEN,
+    so it differs on the periods whose sentence end depends on what the model
+    learnt: abbreviations other than ABBREVIATIONS, single letters before a
+    capitalized word (e.g. J. Smith, split here), and a period followed by
+    punctuation such as a lone " (e.g. 'normal. " x'). A '' at the start of a
+    sentence after the first opens a quote here (``) and not with nltk.
+    """
+    if '"' in text or "''" in text:
+        text = OPENING_DOUBLE_QUOTE_PATTERN.sub(" `` ", text).replace('"', " '' ")
+    return FAST_TOKEN_PATTERN.findall(text)
+
+
+# Built once per process, the same tokenizer is then reused by every pipeline
+@lru_cache(maxsize=None)
+def get_tokenizer(tokenizer_type: str) -> Callable[[str], List[str]]:
+    if tokenizer_type == "fast":
+        return fast_tokenize
+    # nltk takes seconds to import, so it is only imported here
+    elif tokenizer_type == "nltk":
+        from nltk.tokenize import word_tokenize
+
+        return word_tokenize
+    elif tokenizer_type == "standford":
+        from nltk.tokenize.stanford import StanfordTokenizer
+
+        return StanfordTokenizer().tokenize
+    else:
+        raise ValueError(f"Unknown tokenizer type {tokenizer_type}.")
+
+
+@lru_cache(maxsize=MAX_CACHED_MEASURE_RUNS)
+def split_measure_run(run: str) -> str:
+    for pattern, replacement in MEASURE_SPLITS:
+        run = pattern.sub(replacement, run)
+    return run
+
+
+class PreprocessingPipeline:
+    """
+    The preprocessing steps of preprocess_dataset (sections, removal of the
+    patterns, lowercasing, splitting of the measures and tokenization),
+    compiled once from the preprocessing config and applied to each text in
+    a single traversal of the dataset, with the same output as the chain of
+    the dataset functions. The four measure splits only ever match inside a
+    run of digits, dots, x, c and m which starts at a digit, so they are
+    applied to each such run (cached, as measures repeat across reports)
+    by one substitution with a callback instead of four passes on the text.
+    """
+
+    def __init__(
+        self,
+        patterns_to_remove: List[Union[str, Pattern]],
+        lowercase: bool = True,
+        split_measure_text: bool = True,
+        tokenizer_type: Optional[str] = "nltk",
+        sections: Optional[List[str]] = None,
+    ):
+        # To build the same pipeline in the worker processes
+        self.params = {
+            "patterns_to_remove": patterns_to_remove,
+            "lowercase": lowercase,
+            "split_measure_text": split_measure_text,
+            "tokenizer_type": tokenizer_type,
+            "sections": sections,
+        }
+        self.patterns_to_remove = [
+            re.compile(pattern) for pattern in patterns_to_remove
+        ]
+        self.lowercase = lowercase
+        self.split_measure_text = split_measure_text
+        self.tokenize = (
+            get_tokenizer(tokenizer_type) if tokenizer_type is not None else None
+        )
+        self.segmenter = ReportSegmenter() if sections is not None else None
+        self.sections = set(sections) if sections is not None else None
+        if self.segmenter is not None:
+            unknown_section_names = self.sections - set(self.segmenter.section_names)
+            assert (
+                len(unknown_section_names) == 0
+            ), f"Unknown sections {unknown_section_names}, expected some of {self.segmenter.section_names}"
+
+    @classmethod
+    def from_config(cls, preprocessing_config: dict) -> "PreprocessingPipeline":
+        """
+        Build the pipeline from the preprocessing block of the config.
+        """
+        return cls(
+            patterns_to_remove=preprocessing_config["patterns_to_remove"],
+            lowercase=preprocessing_config["lowercase"],
+            split_measure_text=preprocessing_config["split_measure_text"],
+            tokenizer_type=preprocessing_config["tokenizer_type"],
+            sections=preprocessing_config.get("sections"),
+        )
+
+    def preprocess_texts(self, texts: List[str]) -> List[Union[str, List[str]]]:
+        return [self(text) for text in texts]
+
+    def remove_patterns(self, text: str) -> str:
+        # One pass per pattern: a combined regex loses the literal prefix
+        # search of each header and is several times slower with re
+        for pattern in self.patterns_to_remove:
+            text = pattern.sub("", text)
+        return text
+
+    def preprocess_text(self, text: str) -> str:
+        """
+        All the steps but the tokenization.
+        """
+        if self.segmenter is not None:
+            text = get_sections_text(self.segmenter, text, self.sections)
+        text = self.remove_patterns(text).strip()
+        if self.lowercase:
+            text = text.lower()
+        if self.split_measure_text:
+            text = MEASURE_RUN_PATTERN.sub(
+                lambda match: split_measure_run(match.group()), text
+            )
+        return text
+
+    def __call__(self, text: str) -> Union[str, List[str]]:
+        text = self.preprocess_text(text)
+        return self.tokenize(text) if self.tokenize is not None else text
+
+    def preprocess_dataset(self, dataset: List[dict], n_jobs: int = 1) -> List[dict]:
+        """
+        With more than one job, the texts are split in chunks (about four
+        per job) which are preprocessed by a pool of processes, each with its
+        own copy of the pipeline, and put back in the order of the dataset.
+        """
+        assert n_jobs >= 1, f"The number of jobs should be at least 1, got {n_jobs}"
+        texts = [elt["text"] for elt in dataset]
+        if n_jobs == 1 or len(texts) <= 1:
+            preprocessed_texts = self.preprocess_texts(texts)
+        else:
+            chunksize = -(-len(texts) // (n_jobs * 4))
+            chunks = [
+                texts[start : start + chunksize]
+                for start in range(0, len(texts), chunksize)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_worker_pipeline,
+                initargs=(self.params,),
+            ) as executor:
+                preprocessed_texts = [
+                    text
+                    for chunk in executor.map(_preprocess_texts_in_worker, chunks)
+                    for text in chunk
+                ]
+        for elt, text in zip(dataset, preprocessed_texts):
+            elt["text"] = text
+        return dataset
+
+
+# Pipeline of a worker process of PreprocessingPipeline.preprocess_dataset,
+# built once per process rather than sent with every chunk
+_worker_pipeline = None
+
+
+def _init_worker_pipeline(params: dict) -> None:
+    global _worker_pipeline
+    _worker_pipeline = PreprocessingPipeline(**params)
+
+
+def _preprocess_texts_in_worker(texts: List[str]) -> List[Union[str, List[str]]]:
+    return _worker_pipeline.preprocess_texts(texts)
+
+
+DEMO_DATASET_PATH = (
     REPO_DIRECTORY / "data" / "processed_data" / "ultrasound" / "dataset.jsonl"
 )
-dataset = read_jsonlines(dataset_path)
 
 HEADERS = [
     re.compile(r"RENSEIGNEMENT CLINIQUE / CLINICAL INFORMATION[:]?"),
@@ -90,12 +371,34 @@ HEADERS = [
     re.compile(r"FINDINGS[:]?"),
     re.compile(r"(IMPRESSION|[Ii]mpression)s?:?"),
 ]
-patterns_to_remove = HEADERS
 
-dataset = remove_patterns_from_text(dataset, patterns_to_remove)
 
-dataset = split_measure_text(dataset)
+def get_demo_dataset(dataset_path: Path = DEMO_DATASET_PATH) -> List[dict]:
+    """
+    The default dataset, preprocessed as it was when this module ran it at
+    import time.
+    """
+    dataset = read_jsonlines(dataset_path)
+
+    patterns_to_remove = HEADERS
+
+    dataset = remove_patterns_from_text(dataset, patterns_to_remove)
+
+    dataset = split_measure_text(dataset)
+
+    dataset = lowercase_dataset(dataset)
+
+    dataset = tokenize_dataset(dataset, "nltk")
+    return dataset
+
+
+def main():
+    """
+    Demo run: python -m src.utils.preprocessing
+    """
+    dataset = get_demo_dataset()
+    print(f"{len(dataset)} preprocessed reports, e.g. {dataset[0]['text'][:20]}")
 
-dataset = lowercase_dataset(dataset)
 
-dataset = tokenize_dataset(dataset, "nltk")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
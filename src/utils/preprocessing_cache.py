@@ -0,0 +1,111 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from src.utils.cache import DirectoryCache
+from src.utils.corpus import TokenCorpus
+from src.utils.json import get_shard_file_paths, read_jsonlines, write_jsonlines
+
+# Each entry of the cache is a directory named after its key, in which the
+# tokens of the preprocessed texts are stored as the arrays of a TokenCorpus,
+# int32 ids into a vocabulary (token_ids.npy, concatenated, memory-mapped on
+# load) with the start of each text in offsets.npy, and the other fields of
+# the records in records.jsonl
+TOKEN_IDS_FILE_NAME = "token_ids.npy"
+OFFSETS_FILE_NAME = "offsets.npy"
+VOCABULARY_FILE_NAME = "vocabulary.json"
+RECORDS_FILE_NAME = "records.jsonl"
+# Bump when the format of the entries (or the preprocessing output) changes
+CACHE_FORMAT_VERSION = 1
+# Preprocessing parameters which do not change its output
+PREPROCESSING_KEYS_NOT_IN_KEY = ["n_jobs"]
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_file_fingerprint(file_path: Path) -> str:
+    """
+    sha256 of the content of the file.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_preprocessing_cache_key(
+    dataset_config: dict, preprocessing_config: dict
+) -> str:
+    """
+    Key of the preprocessed dataset: a hash of the content of the dataset files
+    (so that a dataset which is moved or touched is still found), of the records
+    drawn from them and of the preprocessing config block.
+    """
+    key_content = {
+        "version": CACHE_FORMAT_VERSION,
+        "dataset": [
+            get_file_fingerprint(path)
+            for path in get_shard_file_paths(dataset_config["path"])
+        ],
+        "n_samples": dataset_config.get("n_samples"),
+        "preprocessing": {
+            key: value
+            for key, value in preprocessing_config.items()
+            if key not in PREPROCESSING_KEYS_NOT_IN_KEY
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(key_content, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class PreprocessingCache(DirectoryCache):
+    """
+    On-disk cache of preprocessed (tokenized) datasets. When the entries take
+    more than max_size_bytes, the least recently used ones are removed.
+    """
+
+    def get(self, key: str) -> Optional[Tuple[List[dict], TokenCorpus]]:
+        """
+        The records of the preprocessed dataset of the key, without their texts,
+        and their texts as a TokenCorpus on the memory-mapped arrays, in the
+        order of the records. None when the dataset is not in the cache.
+        """
+        entry_directory = self.use_entry(key)
+        if entry_directory is None:
+            return None
+        token_ids = np.load(entry_directory / TOKEN_IDS_FILE_NAME, mmap_mode="r")
+        offsets = np.load(entry_directory / OFFSETS_FILE_NAME, mmap_mode="r")
+        with open(entry_directory / VOCABULARY_FILE_NAME, "r") as f:
+            vocabulary = json.load(f)
+        records = read_jsonlines(entry_directory / RECORDS_FILE_NAME)
+        assert (
+            len(offsets) == len(records) + 1
+        ), f"The cache entry {key} has {len(offsets) - 1} texts for {len(records)} records"
+        return records, TokenCorpus(vocabulary, token_ids, offsets)
+
+    def put(self, key: str, dataset: List[dict]) -> None:
+        """
+        Add the preprocessed dataset, whose texts are lists of tokens, to the
+        cache and evict the least recently used entries if it is too big.
+        """
+        if self.get_entry_directory(key).is_dir():
+            return
+        corpus = TokenCorpus.from_texts([elt["text"] for elt in dataset])
+
+        def write_entry(entry_directory: Path) -> None:
+            np.save(entry_directory / TOKEN_IDS_FILE_NAME, corpus.token_ids)
+            np.save(entry_directory / OFFSETS_FILE_NAME, corpus.offsets)
+            with open(entry_directory / VOCABULARY_FILE_NAME, "w") as f:
+                json.dump(corpus.vocabulary, f, ensure_ascii=False)
+            write_jsonlines(
+                (
+                    {field: elt[field] for field in elt if field != "text"}
+                    for elt in dataset
+                ),
+                entry_directory / RECORDS_FILE_NAME,
+            )
+
+        self.add_entry(key, write_entry)
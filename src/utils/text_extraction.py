@@ -1,10 +1,71 @@
+import itertools
 import re
-from typing import List, Union, Pattern
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+
+
+class MarkerMatcher:
+    """
+    One or more markers compiled into a single alternation regex, so that
+    a line is scanned once for all the markers. As with LineFilter, case
+    insensitivity is handled by searching the lowercased markers in the
+    lowercased line (once per line), which keeps the exact semantics of
+    str.lower, e.g. µ and μ are different, unlike with re.IGNORECASE.
+    Can be given in place of the markers to the functions of this module.
+    """
+
+    def __init__(self, markers: Union[str, List[str]], case_insensitive: bool = True):
+        self.markers = markers if isinstance(markers, list) else [markers]
+        self.case_insensitive = case_insensitive
+        # Without markers, (?!) never matches like any() of an empty list
+        self.pattern = re.compile(
+            "|".join(
+                re.escape(marker.lower() if case_insensitive else marker)
+                for marker in self.markers
+            )
+            if len(self.markers) > 0
+            else "(?!)"
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"MarkerMatcher({self.markers!r}, case_insensitive={self.case_insensitive})"
+        )
+
+    def is_in(self, text: str) -> bool:
+        return (
+            self.pattern.search(text.lower() if self.case_insensitive else text)
+            is not None
+        )
+
+
+Markers = Union[str, List[str], MarkerMatcher]
+
+
+def get_marker_matcher(marker: Markers, case_insensitive: bool = True) -> MarkerMatcher:
+    """
+    Compile the markers unless they already are a MarkerMatcher.
+    """
+    if isinstance(marker, MarkerMatcher):
+        return marker
+    return MarkerMatcher(marker, case_insensitive=case_insensitive)
 
 
 def marker_is_in_text(
-    marker: Union[str, List[str]], text: str, case_insensitive: bool = True
+    marker: Markers, text: str, case_insensitive: bool = True
 ) -> bool:
+    # A MarkerMatcher has its own case sensitivity
+    if isinstance(marker, MarkerMatcher):
+        return marker.is_in(text)
     marker = marker if isinstance(marker, list) else [marker]
     if case_insensitive:
         marker = [m.lower() for m in marker]
@@ -13,18 +74,19 @@ def marker_is_in_text(
 
 
 def extract_text_between_markers(
-    start_marker: Union[str, List[str]],
-    end_marker: Union[str, List[str]],
+    start_marker: Markers,
+    end_marker: Markers,
     text_as_list: List[str],
 ) -> List[str]:
-    assert isinstance(start_marker, str) or isinstance(
-        start_marker, list
-    ), "start_marker should be a string or a list of strings"
-    assert isinstance(end_marker, str) or isinstance(
-        end_marker, list
-    ), "end_marker should be a string or a list of one string"
-    start_marker = start_marker if isinstance(start_marker, list) else [start_marker]
-    end_marker = end_marker if isinstance(end_marker, list) else [end_marker]
+    assert isinstance(
+        start_marker, (str, list, MarkerMatcher)
+    ), "start_marker should be a string, a list of strings or a MarkerMatcher"
+    assert isinstance(
+        end_marker, (str, list, MarkerMatcher)
+    ), "end_marker should be a string, a list of strings or a MarkerMatcher"
+    # Compile the markers once rather than for every line
+    start_marker = get_marker_matcher(start_marker)
+    end_marker = get_marker_matcher(end_marker)
     skip_line = True
     start_index = 0
     for index, line in enumerate(text_as_list):
@@ -43,8 +105,8 @@ def extract_text_between_markers(
 
 
 def delete_text_between_markers(
-    start_markers: List[List[str]],
-    end_markers: List[List[str]],
+    start_markers: List[Markers],
+    end_markers: List[Markers],
     text_as_list: List[str],
 ) -> List[str]:
     assert (
@@ -56,6 +118,8 @@ def delete_text_between_markers(
     assert len(start_markers) == len(
         end_markers
     ), "You should have the same number of start and end markers"
+    start_markers = [get_marker_matcher(marker) for marker in start_markers]
+    end_markers = [get_marker_matcher(marker) for marker in end_markers]
     marker_index = 0
     preserved_text = []
     skip_line = False
@@ -82,28 +146,389 @@ def strip_text_lines(text_as_list: List[str]) -> List[str]:
     return [line.strip() for line in text_as_list]
 
 
+def iter_extract_text_between_markers(
+    start_marker: Markers,
+    end_marker: Markers,
+    lines: Iterable[str],
+) -> Iterator[str]:
+    """
+    Lazy equivalent of extract_text_between_markers which stops reading the
+    lines at the end marker, so it can be called again on the same iterator
+    to get the next report of a concatenated export. Like
+    extract_text_between_markers, the text is taken from the first line when
+    there is no start marker, so the lines before the first end marker are
+    kept in memory until a start marker is found.
+    """
+    start_marker = get_marker_matcher(start_marker)
+    end_marker = get_marker_matcher(end_marker)
+    lines = iter(lines)
+    # Lines up to the first end marker, in case there is no start marker
+    lines_without_start = []
+    end_marker_seen = False
+    for line in lines:
+        if start_marker.is_in(line):
+            break
+        if not end_marker_seen:
+            end_marker_seen = end_marker.is_in(line)
+            if not end_marker_seen:
+                lines_without_start.append(line)
+    else:
+        yield from lines_without_start
+        return
+    del lines_without_start
+    # The start line itself can hold the end marker
+    if end_marker.is_in(line):
+        return
+    yield line
+    for line in lines:
+        if end_marker.is_in(line):
+            return
+        yield line
+
+
+def iter_texts_between_markers(
+    start_marker: Markers,
+    end_marker: Markers,
+    lines: Iterable[str],
+) -> Iterator[List[str]]:
+    """
+    Lazily split the lines of concatenated reports into the text between the
+    start and end markers of each report. Unlike extract_text_between_markers,
+    lines without a start marker are not a report.
+    """
+    start_marker = get_marker_matcher(start_marker)
+    end_marker = get_marker_matcher(end_marker)
+    lines = iter(lines)
+    for line in lines:
+        if start_marker.is_in(line):
+            yield list(
+                iter_extract_text_between_markers(
+                    start_marker, end_marker, itertools.chain([line], lines)
+                )
+            )
+
+
+def iter_delete_text_between_markers(
+    start_markers: List[Markers],
+    end_markers: List[Markers],
+    lines: Iterable[str],
+) -> Iterator[str]:
+    """
+    Lazy equivalent of delete_text_between_markers.
+    """
+    assert (
+        isinstance(start_markers, list) and len(start_markers) > 0
+    ), f"start_markers must be a list of one or more strings but it looks like: {start_markers}"
+    assert len(start_markers) == len(
+        end_markers
+    ), "You should have the same number of start and end markers"
+    start_markers = [get_marker_matcher(marker) for marker in start_markers]
+    end_markers = [get_marker_matcher(marker) for marker in end_markers]
+    lines = iter(lines)
+    skip_line = False
+    for start_marker, end_marker in zip(start_markers, end_markers):
+        for line in lines:
+            if start_marker.is_in(line):
+                skip_line = True
+            elif end_marker.is_in(line):
+                skip_line = False
+                break
+            elif not skip_line:
+                yield line
+    yield from lines
+
+
+def iter_remove_whitespace_lines(lines: Iterable[str]) -> Iterator[str]:
+    return (line for line in lines if line.strip() != "")
+
+
+def iter_strip_text_lines(lines: Iterable[str]) -> Iterator[str]:
+    return (line.strip() for line in lines)
+
+
+# Inline letters of the regex flags that can be scoped to a group
+SCOPED_REGEX_FLAGS = {
+    re.IGNORECASE: "i",
+    re.MULTILINE: "m",
+    re.DOTALL: "s",
+    re.ASCII: "a",
+}
+# Regex features that depend on the group numbering or names of the pattern,
+# i.e. backreferences and conditional groups
+GROUP_REFERENCE_PATTERN = re.compile(r"\\[1-9]|\\g<|\(\?P=|\(\?\(")
+
+
+def get_scoped_regex(pattern: Pattern) -> Optional[str]:
+    """
+    The regex as a group carrying its own flags, or None if it cannot be
+    combined with other regexes.
+    """
+    flags = pattern.flags & ~re.UNICODE
+    if flags & ~sum(SCOPED_REGEX_FLAGS) or GROUP_REFERENCE_PATTERN.search(
+        pattern.pattern
+    ):
+        return None
+    scoped_flags = "".join(
+        letter for flag, letter in SCOPED_REGEX_FLAGS.items() if flags & flag
+    )
+    scoped_regex = f"(?{scoped_flags}:{pattern.pattern})"
+    try:
+        # e.g. global inline flags, (?i), are only allowed at the start
+        re.compile(scoped_regex)
+    except re.error:
+        return None
+    return scoped_regex
+
+
+class LineFilter:
+    """
+    Compiled equivalent of the patterns of remove_lines_containing_pattern,
+    built once and reused across files. The strings are combined into one
+    regex searched in the lowercased line (lowercasing the line once rather
+    than using re.IGNORECASE keeps the exact semantics of str.lower) and the
+    regexes are combined into another one, each keeping its own flags. The
+    regexes that cannot be combined, e.g. because of backreferences, are
+    searched on their own.
+    """
+
+    def __init__(
+        self, patterns: List[Union[str, Pattern]], case_insensitive: bool = True
+    ):
+        assert all(
+            isinstance(pattern, (str, Pattern)) for pattern in patterns
+        ), "All patterns should be strings or compiled regexes"
+        self.patterns = patterns
+        self.case_insensitive = case_insensitive
+        strings = [pattern for pattern in patterns if isinstance(pattern, str)]
+        self.string_regex = (
+            re.compile(
+                "|".join(
+                    re.escape(string.lower() if case_insensitive else string)
+                    for string in strings
+                )
+            )
+            if len(strings) > 0
+            else None
+        )
+        regexes = [pattern for pattern in patterns if isinstance(pattern, Pattern)]
+        scoped_regexes = [get_scoped_regex(regex) for regex in regexes]
+        self.separate_regexes = [
+            regex
+            for regex, scoped_regex in zip(regexes, scoped_regexes)
+            if scoped_regex is None
+        ]
+        scoped_regexes = [regex for regex in scoped_regexes if regex is not None]
+        try:
+            self.combined_regex = (
+                re.compile("|".join(scoped_regexes))
+                if len(scoped_regexes) > 0
+                else None
+            )
+        except re.error:
+            # e.g. the same group name in two regexes
+            self.combined_regex = None
+            self.separate_regexes = regexes
+
+    def keeps(self, line: str) -> bool:
+        if self.string_regex is not None and self.string_regex.search(
+            line.lower() if self.case_insensitive else line
+        ):
+            return False
+        if self.combined_regex is not None and self.combined_regex.search(line):
+            return False
+        return all(regex.search(line) is None for regex in self.separate_regexes)
+
+    def filter_lines(self, text_as_list: Iterable[str]) -> List[str]:
+        return [line for line in text_as_list if self.keeps(line)]
+
+    def filter_text(self, text: str) -> str:
+        return "".join(self.filter_lines(text.splitlines(keepends=True)))
+
+    def filter_documents(self, documents: Iterable[List[str]]) -> Iterator[List[str]]:
+        """
+        Lazily filter the lines of each document.
+        """
+        for text_as_list in documents:
+            yield self.filter_lines(text_as_list)
+
+
 def remove_lines_containing_pattern(
-    patterns: List[Union[str, Pattern]],
+    patterns: Union[List[Union[str, Pattern]], LineFilter],
     text_as_list: List[str],
     case_insensitive: bool = True,
 ) -> List[str]:
     # Case insensitivity for the regex goes to the pattern i.e. re.compile(pattern, re.IGNORECASE)
-    assert all(
-        isinstance(pattern, (str, Pattern)) for pattern in patterns
-    ), "All patterns should be strings or compiled regexes"
-    preserved_text = []
-    for line in text_as_list:
-        if all(
-            (
-                isinstance(pattern, str)
-                and not (
-                    pattern.lower() in line.lower()
-                    if case_insensitive
-                    else pattern in line
-                )
+    # A LineFilter has its own case sensitivity
+    if not isinstance(patterns, LineFilter):
+        patterns = LineFilter(patterns, case_insensitive=case_insensitive)
+    return patterns.filter_lines(text_as_list)
+
+
+# Section headers of the ultrasound reports, same regexes as the headers removed
+# in preprocessing. At the same position, the first header of the dict wins.
+REPORT_SECTION_HEADERS = {
+    "clinical_information": re.compile(
+        r"RENSEIGNEMENT CLINIQUE / CLINICAL INFORMATION[:]?"
+    ),
+    "radiologist_report": re.compile(
+        r"PROTOCOLE RADIOLOGIQUE / RADIOLOGIST'S REPORT[:]?"
+    ),
+    "examination": re.compile(
+        r"ULTRASOUND\s*(OF|OF THE)?\s*ABDOMEN AND PELVIS( WITH DOPPLER)?"
+        + r"|ULTRASOUND\s*(OF|OF THE)?\s*ABDOMEN( WITH DOPPLER)?"
+        + r"|ABDOMINAL AND PELVIC ULTRASOUND( WITH DOPPLER)?"
+    ),
+    "findings": re.compile(r"FINDINGS[:]?"),
+    "impression": re.compile(r"(IMPRESSION|[Ii]mpression)s?:?"),
+}
+# Name of the section of the text that comes before the first header
+PREAMBLE_SECTION = "preamble"
+
+
+class Section(NamedTuple):
+    name: str
+    # Offset of the header in the report text (equal to start for the preamble)
+    header_start: int
+    # Offsets of the section content in the report text, header excluded
+    start: int
+    end: int
+    # (start, end) offsets of the pieces of content, there is more than one
+    # when lines between markers were deleted from the middle of the section
+    spans: List[Tuple[int, int]]
+
+
+class SegmentedReport(NamedTuple):
+    text: str
+    sections: List[Section]
+
+    def get_sections(self, name: str) -> List[Section]:
+        return [section for section in self.sections if section.name == name]
+
+    def get_section_text(self, name: str, separator: str = "") -> str:
+        """
+        The content of the sections with this name, sliced from the report text.
+        """
+        return separator.join(
+            "".join(self.text[start:end] for start, end in section.spans)
+            for section in self.get_sections(name)
+        )
+
+
+class ReportSegmenter:
+    """
+    Single pass equivalent of extract_text_between_markers,
+    delete_text_between_markers and the removal of the section headers:
+    a state machine that goes once through the lines of a report and records
+    the offsets of each section instead of building new texts. The section
+    headers are compiled into one regex and the markers into MarkerMatchers
+    once, so a segmenter is meant to be reused across reports. Without body
+    markers, the whole text is segmented (e.g. the text of the dataset).
+    """
+
+    def __init__(
+        self,
+        section_headers: Optional[Dict[str, Union[str, Pattern]]] = None,
+        body_begin_markers: Optional[Markers] = None,
+        body_end_markers: Optional[Markers] = None,
+        body_between_start_markers: Optional[List[Markers]] = None,
+        body_between_end_markers: Optional[List[Markers]] = None,
+    ):
+        section_headers = (
+            section_headers if section_headers is not None else REPORT_SECTION_HEADERS
+        )
+        self.section_names = list(section_headers)
+        scoped_headers = [
+            get_scoped_regex(header) if isinstance(header, Pattern) else f"(?:{header})"
+            for header in section_headers.values()
+        ]
+        assert all(
+            header is not None for header in scoped_headers
+        ), "Section headers cannot use group references or global inline flags"
+        # Section i is found through the group _i
+        self.header_regex = re.compile(
+            "|".join(
+                f"(?P<_{index}>{header})" for index, header in enumerate(scoped_headers)
             )
-            or (isinstance(pattern, Pattern) and re.search(pattern, line) is None)
-            for pattern in patterns
-        ):
-            preserved_text.append(line)
-    return preserved_text
+        )
+        self.body_begin_markers = (
+            get_marker_matcher(body_begin_markers)
+            if body_begin_markers is not None
+            else None
+        )
+        self.body_end_markers = (
+            get_marker_matcher(body_end_markers)
+            if body_end_markers is not None
+            else None
+        )
+        self.body_between_start_markers = [
+            get_marker_matcher(marker) for marker in body_between_start_markers or []
+        ]
+        self.body_between_end_markers = [
+            get_marker_matcher(marker) for marker in body_between_end_markers or []
+        ]
+        assert len(self.body_between_start_markers) == len(
+            self.body_between_end_markers
+        ), "You should have the same number of start and end markers"
+
+    def segment(self, text: str) -> SegmentedReport:
+        sections = []
+        # Like extract_text_between_markers, the body starts at the first
+        # line when there is no begin marker
+        body_begun = self.body_begin_markers is None or not (
+            self.body_begin_markers.is_in(text)
+        )
+        marker_index = 0
+        skip_line = False
+        line_start = 0
+        while line_start < len(text):
+            line_end = text.find("\n", line_start) + 1 or len(text)
+            line = text[line_start:line_end]
+            if not body_begun:
+                body_begun = self.body_begin_markers.is_in(line)
+            if not body_begun:
+                pass
+            elif self.body_end_markers is not None and self.body_end_markers.is_in(
+                line
+            ):
+                break
+            elif marker_index < len(self.body_between_start_markers):
+                # Same as delete_text_between_markers
+                if self.body_between_start_markers[marker_index].is_in(line):
+                    skip_line = True
+                elif self.body_between_end_markers[marker_index].is_in(line):
+                    skip_line = False
+                    marker_index += 1
+                elif not skip_line:
+                    self._add_line(text, sections, line_start, line_end)
+            else:
+                self._add_line(text, sections, line_start, line_end)
+            line_start = line_end
+        return SegmentedReport(text, sections)
+
+    def _add_line(
+        self, text: str, sections: List[Section], line_start: int, line_end: int
+    ) -> None:
+        content_start = line_start
+        for match in self.header_regex.finditer(text, line_start, line_end):
+            self._add_content(sections, content_start, match.start())
+            name = self.section_names[int(match.lastgroup[1:])]
+            sections.append(Section(name, match.start(), match.end(), match.end(), []))
+            content_start = match.end()
+        self._add_content(sections, content_start, line_end)
+
+    @staticmethod
+    def _add_content(sections: List[Section], start: int, end: int) -> None:
+        if start == end:
+            return
+        if len(sections) == 0:
+            sections.append(Section(PREAMBLE_SECTION, start, start, start, []))
+        section = sections[-1]
+        spans = section.spans
+        if len(spans) > 0 and spans[-1][1] == start:
+            # Extend the piece of content rather than starting a new one
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+        sections[-1] = section._replace(
+            start=spans[0][0] if len(spans) == 1 else section.start, end=end
+        )
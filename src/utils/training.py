@@ -1,54 +1,101 @@
-from typing import List, Tuple, Union
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
 import numpy as np
 import numpy.typing as npt
-from nltk.corpus import stopwords
-from sklearn import base
-from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
-from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.neural_network import MLPClassifier
-from sklearn.pipeline import Pipeline
-from sklearn.svm import SVC
-from sklearn.tree import DecisionTreeClassifier
 from src import RANDOM_SEED
+from src.utils.corpus import TokenCorpus
+from src.utils.features import FeatureStore, get_feature_rows
+
+# sklearn and nltk take seconds to import, they are imported by the functions
+# which use them so that importing this module stays cheap
+if TYPE_CHECKING:
+    from sklearn import base
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    from sklearn.pipeline import Pipeline
+
+# The dtype of the document-term matrices of each vectorizer type, rather than
+# sklearn's int64 and float64
+VECTORIZER_DTYPES = {"count": np.int32, "tfidf": np.float32}
 
 
 def get_components_from_dataset(
     dataset: List[dict],
-) -> Tuple[npt.NDArray[np.object0], npt.NDArray[np.int64], npt.NDArray[np.object0]]:
+    feature_store: Optional[FeatureStore] = None,
+    corpus: Optional[TokenCorpus] = None,
+) -> Tuple[
+    Union[TokenCorpus, npt.NDArray[np.object_]], npt.NDArray[np.int64], npt.NDArray
+]:
     """
-    Get text, labels and features as numpy arrays from the dataset.
+    Get text, labels and features from the dataset. Tokenized texts become a
+    TokenCorpus, the other texts and the labels and features numpy arrays.
+    With a corpus (e.g. from PreprocessingCache.get), the texts are those of
+    the corpus, in the order of the dataset, rather than those of its records.
+    The features are the rows of the feature store, in the order of the dataset,
+    found through the feature_row of each element (or its id when it has none).
+    The records without features get a row of NaN.
+    Without a feature store, the features are an empty (n, 0) matrix.
     """
     # Get the texts
-    texts = np.array([elt["text"] for elt in dataset], dtype=object)
+    if corpus is not None:
+        assert len(corpus) == len(
+            dataset
+        ), f"{len(corpus)} texts in the corpus for {len(dataset)} records"
+        texts = corpus
+    else:
+        texts = [elt["text"] for elt in dataset]
+        if len(texts) > 0 and all(isinstance(text, list) for text in texts):
+            texts = TokenCorpus.from_texts(texts)
+        else:
+            texts = np.array(texts, dtype=object)
     # Get the labels
     labels = np.array([int(elt["label"]) for elt in dataset], dtype=np.int64)
     # Get the features
-    features = np.array([elt["features"] for elt in dataset], dtype=object)
+    if feature_store is None:
+        features = np.empty((len(dataset), 0), dtype=np.float32)
+    else:
+        rows = [
+            elt["feature_row"]
+            if "feature_row" in elt
+            else feature_store.id_to_row.get(elt["id"], -1)
+            for elt in dataset
+        ]
+        features = get_feature_rows(feature_store, rows)
     return texts, labels, features
 
 
-def get_split_dataset_index(
-    dataset: List[dict], train_test_ratio_split: float = 0.9, seed: int = 42
+def get_split_index(
+    n_records: int, train_test_ratio_split: float = 0.9, seed: int = 42
 ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    from sklearn.model_selection import train_test_split
+
     # List of indices
-    indices = np.arange(len(dataset))
+    indices = np.arange(n_records)
     train_index, test_index = train_test_split(
         indices, train_size=train_test_ratio_split, random_state=seed
     )
     return train_index, test_index
 
 
+def get_split_dataset_index(
+    dataset: List[dict], train_test_ratio_split: float = 0.9, seed: int = 42
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    return get_split_index(len(dataset), train_test_ratio_split, seed)
+
+
 def get_train_and_test_set(
-    dataset: List[dict], train_test_ratio_split: float = 0.8, seed: int = 42
+    dataset: List[dict],
+    train_test_ratio_split: float = 0.8,
+    seed: int = 42,
+    feature_store: Optional[FeatureStore] = None,
+    corpus: Optional[TokenCorpus] = None,
 ) -> Tuple[dict, dict]:
     """
     Get the components from the dataset and split them into
-    train and test.
+    train and test. See get_components_from_dataset for the corpus.
     """
-    texts, labels, features = get_components_from_dataset(dataset)
+    texts, labels, features = get_components_from_dataset(
+        dataset, feature_store, corpus
+    )
     train_index, test_index = get_split_dataset_index(
         dataset, train_test_ratio_split, seed
     )
@@ -80,27 +127,41 @@ def create_vectorizer(
     remove_stopwords: bool = True,
     ngram_range: tuple = (1, 1),
     binary: bool = False,
-) -> Union[CountVectorizer, TfidfVectorizer]:
+    dtype: Optional[npt.DTypeLike] = None,
+) -> Union["CountVectorizer", "TfidfVectorizer"]:
+    """
+    Vectorizer of tokenized texts. The texts of a TokenCorpus are counted
+    directly on their token ids, with the same features and counts.
+    The matrices have sklearn's dtype unless one is given (see VECTORIZER_DTYPES).
+    """
+    from nltk.corpus import stopwords
+    from src.utils.vectorizers import (
+        TokenCorpusCountVectorizer,
+        TokenCorpusTfidfVectorizer,
+    )
+
     stop_words = None if not remove_stopwords else stopwords.words("english")
     ngram_range = (
         tuple(ngram_range) if not isinstance(ngram_range, tuple) else ngram_range
     )
     if vectorizer_type == "count":
-        vectorizer = CountVectorizer(
+        vectorizer = TokenCorpusCountVectorizer(
             lowercase=False,
             preprocessor=lambda x: x,
             tokenizer=lambda x: x,
             stop_words=stop_words,
             ngram_range=ngram_range,
             binary=binary,
+            **({"dtype": dtype} if dtype is not None else {}),
         )
     elif vectorizer_type == "tfidf":
-        vectorizer = TfidfVectorizer(
+        vectorizer = TokenCorpusTfidfVectorizer(
             lowercase=False,
             preprocessor=lambda x: x,
             tokenizer=lambda x: x,
             stop_words=stop_words,
             ngram_range=ngram_range,
+            **({"dtype": dtype} if dtype is not None else {}),
         )
     else:
         raise ValueError(f"Unsupported vectorizer type: {vectorizer_type}")
@@ -108,18 +169,48 @@ def create_vectorizer(
     return vectorizer
 
 
-def create_model(model_type: str, **model_params) -> base.ClassifierMixin:
+def set_vectorizer_vocabulary(
+    vectorizer: Union["CountVectorizer", "TfidfVectorizer"],
+    feature_names: List[str],
+    idf: Optional[npt.NDArray] = None,
+) -> None:
+    """
+    Make the vectorizer as if it had been fitted, from its features (in the
+    order of the columns) and, for tf-idf, their idf weights.
+    """
+    vectorizer.vocabulary_ = {
+        feature_name: column for column, feature_name in enumerate(feature_names)
+    }
+    vectorizer.fixed_vocabulary_ = False
+    if idf is not None:
+        vectorizer.idf_ = idf
+
+
+def create_model(model_type: str, **model_params) -> "base.ClassifierMixin":
+    # Only the module of the model type is imported
     if model_type == "logistic":
+        from sklearn.linear_model import LogisticRegression
+
         model = LogisticRegression(**model_params)
     elif model_type == "svm":
+        from sklearn.svm import SVC
+
         model = SVC(**model_params)
     elif model_type == "decision_tree":
+        from sklearn.tree import DecisionTreeClassifier
+
         model = DecisionTreeClassifier(**model_params)
     elif model_type == "random_forest":
+        from sklearn.ensemble import RandomForestClassifier
+
         model = RandomForestClassifier(**model_params)
     elif model_type == "gradient_boosting":
+        from sklearn.ensemble import GradientBoostingClassifier
+
         model = GradientBoostingClassifier(**model_params)
     elif model_type == "mlp":
+        from sklearn.neural_network import MLPClassifier
+
         model = MLPClassifier(**model_params)
     else:
         raise ValueError(f"Unsupported model type: {model_type}")
@@ -127,39 +218,51 @@ def create_model(model_type: str, **model_params) -> base.ClassifierMixin:
 
 
 def create_classifier(
-    vectorizer: Union[CountVectorizer, TfidfVectorizer],
-    model: base.ClassifierMixin,
-) -> Pipeline:
+    vectorizer: Union["CountVectorizer", "TfidfVectorizer"],
+    model: "base.ClassifierMixin",
+) -> "Pipeline":
+    from sklearn.pipeline import Pipeline
+
     return Pipeline([("vectorizer", vectorizer), ("model", model)])
 
 
 def train_classifier(
-    classifier: Pipeline,
+    classifier: "Pipeline",
     X_train: npt.NDArray[np.float64],
     y_train: npt.NDArray[np.int64],
 ) -> None:
     classifier.fit(X_train, y_train)
 
 
-from src.utils.preprocessing import dataset
-from sklearn.metrics import classification_report
+def main():
+    """
+    Demo run: train an svm on the default dataset (see
+    src.utils.preprocessing.main) and print its scores.
+    python -m src.utils.training
+    """
+    from sklearn.metrics import classification_report
+    from src.utils.preprocessing import get_demo_dataset
+
+    dataset = get_demo_dataset()
+
+    train_set, test_set = get_train_and_test_set(
+        dataset, train_test_ratio_split=0.8, seed=RANDOM_SEED
+    )
 
-texts, labels, features = get_components_from_dataset(dataset)
+    vectorizer = create_vectorizer(vectorizer_type="count")
 
-train_set, test_set = get_train_and_test_set(
-    dataset, train_test_ratio_split=0.8, seed=RANDOM_SEED
-)
+    model = create_model(model_type="svm")
 
-vectorizer = create_vectorizer(vectorizer_type="count")
+    classifier = create_classifier(vectorizer, model)
 
-model = create_model(model_type="svm")
+    train_classifier(classifier, train_set["texts"], train_set["labels"])
 
-classifier = create_classifier(vectorizer, model)
+    print(classifier.score(train_set["texts"], train_set["labels"]))
 
-train_classifier(classifier, train_set["texts"], train_set["labels"])
+    y_true = test_set["labels"]
+    y_pred = classifier.predict(test_set["texts"])
+    print(classification_report(y_true, y_pred))
 
-print(classifier.score(train_set["texts"], train_set["labels"]))
 
-y_true = test_set["labels"]
-y_pred = classifier.predict(test_set["texts"])
-classification_report_dict = classification_report(y_true, y_pred, output_dict=True)
+if __name__ == "__main__":
+    main()
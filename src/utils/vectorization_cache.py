@@ -0,0 +1,104 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+
+import numpy as np
+import numpy.typing as npt
+from src.utils.cache import DirectoryCache
+
+if TYPE_CHECKING:
+    import scipy.sparse as sp
+
+# Each entry of the cache is a directory named after its key, with the names
+# of the features in the order of the columns (vocabulary.json), their idf
+# weights for tf-idf (idf.npy) and the train and test document-term matrices
+# as sparse .npz files, in the dtypes of src.utils.training.VECTORIZER_DTYPES
+VOCABULARY_FILE_NAME = "vocabulary.json"
+IDF_FILE_NAME = "idf.npy"
+TRAIN_MATRIX_FILE_NAME = "train.npz"
+TEST_MATRIX_FILE_NAME = "test.npz"
+# Bump when the format of the entries (or the vectorizers output) changes
+CACHE_FORMAT_VERSION = 1
+
+
+class DocumentTermMatrices(NamedTuple):
+    # Names of the features, in the order of the columns
+    feature_names: List[str]
+    # idf weights of the features for tf-idf, None otherwise
+    idf: Optional[npt.NDArray[np.float64]]
+    train_matrix: "sp.csr_matrix"
+    test_matrix: "sp.csr_matrix"
+
+
+def get_vectorization_cache_key(
+    preprocessing_cache_key: str, split_config: dict, vectorizer_config: dict
+) -> str:
+    """
+    Key of the document-term matrices: a hash of the key of the preprocessed
+    dataset (see get_preprocessing_cache_key), of the train/test split and of
+    the vectorizer config block. The model does not change them.
+    """
+    key_content = {
+        "version": CACHE_FORMAT_VERSION,
+        "preprocessing": preprocessing_cache_key,
+        "split": split_config,
+        "vectorizer": vectorizer_config,
+    }
+    return hashlib.sha256(
+        json.dumps(key_content, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class VectorizationCache(DirectoryCache):
+    """
+    On-disk cache of the fitted vocabulary and the train and test document-term
+    matrices, so that the texts are vectorized once for all the models trained
+    on them. When the entries take more than max_size_bytes, the least recently
+    used ones are removed.
+    """
+
+    def get(self, key: str) -> Optional[DocumentTermMatrices]:
+        """
+        The document-term matrices of the key, None when they are not in the cache.
+        """
+        import scipy.sparse as sp
+
+        entry_directory = self.use_entry(key)
+        if entry_directory is None:
+            return None
+        with open(entry_directory / VOCABULARY_FILE_NAME, "r") as f:
+            feature_names = json.load(f)
+        idf_path = entry_directory / IDF_FILE_NAME
+        return DocumentTermMatrices(
+            feature_names=feature_names,
+            idf=np.load(idf_path) if idf_path.exists() else None,
+            train_matrix=sp.load_npz(entry_directory / TRAIN_MATRIX_FILE_NAME),
+            test_matrix=sp.load_npz(entry_directory / TEST_MATRIX_FILE_NAME),
+        )
+
+    def put(self, key: str, matrices: DocumentTermMatrices) -> None:
+        """
+        Add the document-term matrices to the cache and evict the least recently
+        used entries if it is too big.
+        """
+        import scipy.sparse as sp
+
+        def write_entry(entry_directory: Path) -> None:
+            with open(entry_directory / VOCABULARY_FILE_NAME, "w") as f:
+                json.dump(matrices.feature_names, f, ensure_ascii=False)
+            if matrices.idf is not None:
+                np.save(entry_directory / IDF_FILE_NAME, matrices.idf)
+            # Not compressed, so that they are loaded as fast as they are read
+            sp.save_npz(
+                entry_directory / TRAIN_MATRIX_FILE_NAME,
+                matrices.train_matrix,
+                compressed=False,
+            )
+            sp.save_npz(
+                entry_directory / TEST_MATRIX_FILE_NAME,
+                matrices.test_matrix,
+                compressed=False,
+            )
+
+        self.add_entry(key, write_entry)
@@ -0,0 +1,243 @@
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from src.utils.corpus import TokenCorpus
+
+# NOTE: This module imports sklearn, it is only imported by the functions of
+# src.utils.training which create the vectorizers
+
+
+def get_ngram_keys(
+    token_ids: npt.NDArray[np.int64],
+    text_index: npt.NDArray[np.int64],
+    n: int,
+    base: int,
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Each n-gram of consecutive tokens of a same text as a single integer,
+    its token ids + 1 written in the given base, and the text of each n-gram.
+    """
+    n_ngrams = len(token_ids) - n + 1
+    if n_ngrams <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = token_ids[:n_ngrams] + 1
+    for i in range(1, n):
+        keys = keys * base + token_ids[i : i + n_ngrams] + 1
+    in_one_text = text_index[:n_ngrams] == text_index[n - 1 :]
+    return keys[in_one_text], text_index[:n_ngrams][in_one_text]
+
+
+def get_ngram_feature_names(
+    keys: npt.NDArray[np.int64], vocabulary: List[str], base: int, max_n: int
+) -> List[str]:
+    """
+    Names of the n-grams of the sorted keys: their tokens joined by spaces,
+    as the vectorizers name the n-grams.
+    """
+    vocabulary = np.array(vocabulary, dtype=object)
+    feature_names = []
+    for n in range(1, max_n + 1):
+        # The keys of the n-grams are between base ** (n - 1) and base ** n
+        ngram_keys = keys[(keys >= base ** (n - 1)) & (keys < base**n)]
+        ngram_names = vocabulary[ngram_keys // base ** (n - 1) - 1]
+        for i in range(n - 2, -1, -1):
+            ngram_names = (
+                ngram_names + " " + vocabulary[ngram_keys // base**i % base - 1]
+            )
+        feature_names.extend(ngram_names.tolist())
+    return feature_names
+
+
+def get_feature_keys(
+    vocabulary: Dict[str, int], corpus_vocabulary: List[str], base: int
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Sorted keys of the features of the vocabulary (feature name -> column)
+    which are made of tokens of the corpus, and the column of each key.
+    """
+    token_to_id = {token: token_id for token_id, token in enumerate(corpus_vocabulary)}
+    feature_keys, feature_columns = [], []
+    for feature_name, column in vocabulary.items():
+        key = 0
+        for token in feature_name.split(" "):
+            token_id = token_to_id.get(token)
+            if token_id is None:
+                break
+            key = key * base + token_id + 1
+        else:
+            feature_keys.append(key)
+            feature_columns.append(column)
+    feature_keys = np.array(feature_keys, dtype=np.int64)
+    order = np.argsort(feature_keys)
+    return feature_keys[order], np.array(feature_columns, dtype=np.int64)[order]
+
+
+def can_count_corpus_features(corpus_vocabulary: List[str], max_n: int) -> bool:
+    """
+    Whether the n-grams of the corpus can be counted on their keys: the keys of
+    its max_n-grams fit in int64 and no token contains a space (the n-grams
+    would otherwise not be told apart from their names).
+    """
+    # Python integers, so that the check does not overflow itself
+    base = len(corpus_vocabulary) + 1
+    return base**max_n <= np.iinfo(np.int64).max and not any(
+        " " in token for token in corpus_vocabulary
+    )
+
+
+def count_corpus_features(
+    corpus: TokenCorpus,
+    ngram_range: Tuple[int, int] = (1, 1),
+    stop_words: Optional[FrozenSet[str]] = None,
+    vocabulary: Optional[Dict[str, int]] = None,
+    dtype: npt.DTypeLike = np.int64,
+    feature_keys: Optional[Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]] = None,
+) -> Tuple[Dict[str, int], sp.csr_matrix, npt.NDArray[np.int64]]:
+    """
+    The (n_texts, n_features) counts of the n-grams of the texts of the corpus
+    and the column of each n-gram, in numpy on the token ids, and the sorted
+    keys of the features. With vocabulary (feature name -> column), only its
+    features are counted, through their keys (from get_feature_keys, made here
+    when they are not given). The stop words are removed before the n-grams
+    are made and the n-grams are named after their tokens joined by spaces, as
+    CountVectorizer does.
+    """
+    min_n, max_n = ngram_range
+    # Ids start at 1 so that the n-grams of different lengths have different keys
+    base = len(corpus.vocabulary) + 1
+    if not can_count_corpus_features(corpus.vocabulary, max_n):
+        raise ValueError(
+            f"The {max_n}-grams of the {base - 1} tokens of the corpus cannot be"
+            + " counted on int64 keys, see can_count_corpus_features"
+        )
+    token_ids, text_index = corpus.get_flat_token_ids()
+    token_ids = token_ids.astype(np.int64)
+    if stop_words is not None:
+        is_kept = np.array(
+            [token not in stop_words for token in corpus.vocabulary], dtype=bool
+        )
+        if len(is_kept) > 0:
+            is_kept = is_kept[token_ids]
+            token_ids, text_index = token_ids[is_kept], text_index[is_kept]
+    ngram_keys, ngram_text_index = zip(
+        *(
+            get_ngram_keys(token_ids, text_index, n, base)
+            for n in range(min_n, max_n + 1)
+        )
+    )
+    keys, text_index = np.concatenate(ngram_keys), np.concatenate(ngram_text_index)
+    if vocabulary is None:
+        feature_keys, columns = np.unique(keys, return_inverse=True)
+        vocabulary = {
+            feature_name: column
+            for column, feature_name in enumerate(
+                get_ngram_feature_names(feature_keys, corpus.vocabulary, base, max_n)
+            )
+        }
+        if len(vocabulary) == 0:
+            raise ValueError(
+                "empty vocabulary; perhaps the documents only contain stop words"
+            )
+    else:
+        feature_keys, feature_columns = (
+            feature_keys
+            if feature_keys is not None
+            else get_feature_keys(vocabulary, corpus.vocabulary, base)
+        )
+        # The n-grams which are not features are left out
+        positions = np.minimum(
+            np.searchsorted(feature_keys, keys), max(len(feature_keys) - 1, 0)
+        )
+        is_feature = (
+            feature_keys[positions] == keys
+            if len(feature_keys) > 0
+            else np.zeros(len(keys), dtype=bool)
+        )
+        columns = feature_columns[positions[is_feature]]
+        text_index = text_index[is_feature]
+    # The counts of the same (text, n-gram) are summed
+    counts = sp.csr_matrix(
+        (np.ones(len(columns), dtype=dtype), (text_index, columns)),
+        shape=(len(corpus), len(vocabulary)),
+        dtype=dtype,
+    )
+    counts.sum_duplicates()
+    counts.sort_indices()
+    return vocabulary, counts, feature_keys
+
+
+class TokenCorpusVectorizerMixin:
+    """
+    Counts the n-grams of a TokenCorpus in numpy, on its token ids, rather
+    than by hashing the n-grams of each text one at a time, with the same
+    features and counts. The other inputs, and the corpora whose n-grams do not
+    fit in int64 keys (see can_count_corpus_features), are counted by the
+    vectorizer, one decoded text at a time.
+    Overrides CountVectorizer._count_vocab, on which fit, fit_transform and
+    transform rely.
+    """
+
+    def _count_vocab(self, raw_documents, fixed_vocab):
+        if not isinstance(raw_documents, TokenCorpus):
+            return super()._count_vocab(raw_documents, fixed_vocab)
+        if not can_count_corpus_features(raw_documents.vocabulary, self.ngram_range[1]):
+            if not fixed_vocab:
+                self._corpus_features = None
+            return super()._count_vocab(raw_documents, fixed_vocab)
+        stop_words = self.get_stop_words()
+        vocabulary, counts, feature_keys = count_corpus_features(
+            raw_documents,
+            ngram_range=self.ngram_range,
+            stop_words=frozenset(stop_words) if stop_words is not None else None,
+            vocabulary=self.vocabulary_ if fixed_vocab else None,
+            dtype=self.dtype,
+            feature_keys=self._get_corpus_feature_keys(raw_documents.vocabulary)
+            if fixed_vocab
+            else None,
+        )
+        if not fixed_vocab:
+            # Kept to transform other views on the same corpus (e.g. the test
+            # set) without making the keys of the features from their names
+            self._corpus_features = (
+                raw_documents.vocabulary,
+                vocabulary,
+                list(vocabulary),
+                feature_keys,
+            )
+        return vocabulary, counts
+
+    def _get_corpus_feature_keys(
+        self, corpus_vocabulary: List[str]
+    ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        corpus_features = getattr(self, "_corpus_features", None)
+        if (
+            corpus_features is None
+            or corpus_features[0] is not corpus_vocabulary
+            or corpus_features[1] is not self.vocabulary_
+        ):
+            return get_feature_keys(
+                self.vocabulary_, corpus_vocabulary, len(corpus_vocabulary) + 1
+            )
+        _, vocabulary, feature_names, feature_keys = corpus_features
+        # The vocabulary keeps the order of the counted features, without those
+        # removed after counting (max_df, min_df, max_features) and with their
+        # final columns
+        is_kept = np.fromiter(
+            (feature_name in vocabulary for feature_name in feature_names),
+            dtype=bool,
+            count=len(feature_names),
+        )
+        return feature_keys[is_kept], np.fromiter(
+            vocabulary.values(), dtype=np.int64, count=len(vocabulary)
+        )
+
+
+class TokenCorpusCountVectorizer(TokenCorpusVectorizerMixin, CountVectorizer):
+    pass
+
+
+class TokenCorpusTfidfVectorizer(TokenCorpusVectorizerMixin, TfidfVectorizer):
+    pass
@@ -1,15 +1,21 @@
-from typing import List, Union
+from typing import TYPE_CHECKING, List, Union
 import numpy as np
 import numpy.typing as npt
-from sklearn.metrics import classification_report, confusion_matrix
-import plotly.graph_objs as go
-import wandb
-import pandas as pd
+
+# wandb, plotly, pandas and sklearn are slow to import, they are imported
+# by the functions which use them
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
+    import wandb
 
 
 def get_classification_report_visualization(
     y_true: npt.NDArray[np.int64], y_pred: npt.NDArray[np.int64], digits=5
-) -> dict[str, wandb.Table]:
+) -> dict[str, "wandb.Table"]:
+    import pandas as pd
+    import wandb
+    from sklearn.metrics import classification_report
+
     # Get the classification report as a dictionary from sklearn
     classification_report_dict = classification_report(
         y_true, y_pred, digits=digits, output_dict=True
@@ -31,7 +37,11 @@ def get_classification_report_visualization(
 
 def get_confusion_matrix_visualization(
     y_true: npt.NDArray[np.int64], y_pred: npt.NDArray[np.int64]
-) -> dict[str, go.Figure]:
+) -> dict[str, "go.Figure"]:
+    import plotly.graph_objs as go
+    import wandb
+    from sklearn.metrics import confusion_matrix
+
     # Part of this code is taken from:
     # https://colab.research.google.com/drive/1k89TDv8ybckgfVByUIhY6peBjtNGBH-k?usp=sharing#scrollTo=RO1MSGLeAzWp
     labels = np.sort(np.unique(y_true))
@@ -138,11 +148,13 @@ def _fill_list(
 
 
 def get_confused_examples_visualization(
-    x: npt.NDArray[np.object0],
+    x: npt.NDArray[np.object_],
     y_true: npt.NDArray[np.int64],
     y_pred: npt.NDArray[np.int64],
     max_confused_examples=3,
-) -> dict[str, wandb.data_types.Plotly]:
+) -> dict[str, "wandb.Table"]:
+    import wandb
+
     # Get examples of correct and incorrect examples
     # for each class
     labels = np.sort(np.unique(y_true))
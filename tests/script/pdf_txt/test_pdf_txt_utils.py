@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+from script.pdf_txt.utils import (
+    NOT_EXTRACTABLE_ERROR,
+    PdfTextManifest,
+    get_changed_pdf_file_paths,
+    map_in_bounded_chunks,
+    read_pdf_text,
+)
+
+
+class ImmediateExecutor:
+    """
+    Runs the submitted chunks right away and keeps track of the number of
+    chunks whose result has not been consumed yet.
+    """
+
+    def __init__(self):
+        self.n_pending_chunks = 0
+        self.max_pending_chunks = 0
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        self.n_pending_chunks += 1
+        self.max_pending_chunks = max(self.max_pending_chunks, self.n_pending_chunks)
+        result = future.result
+
+        def consume_result():
+            self.n_pending_chunks -= 1
+            return result()
+
+        future.result = consume_result
+        return future
+
+
+@pytest.mark.parametrize("n_items, chunksize", [(0, 2), (7, 1), (7, 3), (10, 16)])
+def test_map_in_bounded_chunks(n_items, chunksize):
+    executor = ImmediateExecutor()
+    items = list(range(n_items))
+    results = map_in_bounded_chunks(
+        executor, lambda x: x * x, items, chunksize=chunksize, max_pending_chunks=2
+    )
+    assert list(results) == [x * x for x in items]
+    assert executor.max_pending_chunks <= 2 and executor.n_pending_chunks == 0
+
+
+@pytest.fixture
+def pdf_file_paths(tmp_path):
+    (tmp_path / "pdf").mkdir()
+    pdf_file_paths = [tmp_path / "pdf" / f"{name}.pdf" for name in "abc"]
+    for path in pdf_file_paths:
+        path.write_bytes(f"%PDF {path.name}".encode())
+    return pdf_file_paths
+
+
+def get_manifest(text_folder_output_path, dpi=200):
+    return PdfTextManifest(
+        text_folder_output_path, "ultrasound", "direct", ocr_params={"dpi": dpi}
+    )
+
+
+def test_pdf_text_manifest(tmp_path, pdf_file_paths):
+    a_path, b_path, c_path = pdf_file_paths
+    with get_manifest(tmp_path) as manifest:
+        assert get_changed_pdf_file_paths(pdf_file_paths, manifest) == pdf_file_paths
+        for path in [a_path, b_path]:
+            (tmp_path / f"{path.stem}.txt").write_text("text")
+            manifest.record(path, page_sources=["text_layer"])
+        manifest.record_failure(c_path, NOT_EXTRACTABLE_ERROR)
+    # Touched with the same content, changed content and missing text file
+    os.utime(a_path, ns=(0, 0))
+    b_path.write_bytes(b"%PDF changed")
+    with get_manifest(tmp_path) as manifest:
+        assert get_changed_pdf_file_paths(pdf_file_paths, manifest) == [b_path]
+        assert manifest.entries["c.pdf"]["error"] == NOT_EXTRACTABLE_ERROR
+        (tmp_path / "a.txt").unlink()
+        assert get_changed_pdf_file_paths(pdf_file_paths, manifest) == [a_path, b_path]
+    # Other extraction parameters
+    with get_manifest(tmp_path, dpi=300) as manifest:
+        assert get_changed_pdf_file_paths(pdf_file_paths, manifest) == pdf_file_paths
+
+
+def test_read_pdf_text_failures(tmp_path, pdf_file_paths):
+    with get_manifest(tmp_path) as manifest:
+        pdf_texts = read_pdf_text(
+            pdf_file_paths, "ultrasound", None, on_failure=manifest.record_failure
+        )
+        assert list(pdf_texts) == []
+        assert all(
+            manifest.entries[path.name]["error"] is not None for path in pdf_file_paths
+        )
+        assert get_changed_pdf_file_paths(pdf_file_paths, manifest) == []
@@ -0,0 +1,27 @@
+import pytest
+from script.preproc_and_train.utils import get_dataset
+from src.utils.json import read_jsonlines, write_jsonlines
+
+DATASET = [
+    {"id": str(i), "text": f"Impression: {i}", "label": i % 2} for i in range(10)
+]
+
+
+@pytest.mark.parametrize(
+    "file_name", ["dataset.jsonl", "dataset.jsonl.gz", "dataset-*.jsonl.gz"]
+)
+def test_get_dataset_n_samples(tmp_path, file_name):
+    if "*" in file_name:
+        for shard_index in range(2):
+            write_jsonlines(
+                DATASET[shard_index * 5 : (shard_index + 1) * 5],
+                tmp_path / f"dataset-{shard_index}.jsonl.gz",
+            )
+    else:
+        write_jsonlines(DATASET, tmp_path / file_name)
+    config = {"dataset": {"path": str(tmp_path / file_name), "n_samples": 4}}
+    samples = get_dataset(config)
+    assert len(samples) == 4 and all(sample in DATASET for sample in samples)
+    assert samples == get_dataset(config)
+    del config["dataset"]["n_samples"]
+    assert get_dataset(config) == read_jsonlines(tmp_path / file_name) == DATASET
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from src.utils.corpus import TokenCorpus
+from src.utils.vectorizers import (
+    TokenCorpusCountVectorizer,
+    TokenCorpusTfidfVectorizer,
+)
+
+TEXTS = [
+    ["the", "liver", "is", "normal", "."],
+    [],
+    ["no", "focal", "lesion", "in", "the", "liver", "."],
+    ["the", "spleen", "is", "normal", "in", "size", "."],
+    ["the", "."],
+]
+
+
+def test_token_corpus():
+    corpus = TokenCorpus.from_texts(TEXTS)
+    assert len(corpus) == len(TEXTS)
+    assert list(corpus) == TEXTS
+    assert corpus[2] == TEXTS[2]
+    view = corpus[[3, 1, 0]]
+    assert view.token_ids is corpus.token_ids
+    assert list(view) == [TEXTS[3], TEXTS[1], TEXTS[0]]
+    assert list(view[1:]) == [TEXTS[1], TEXTS[0]]
+    token_ids, text_index = view.get_flat_token_ids()
+    assert view.decode(token_ids) == TEXTS[3] + TEXTS[0]
+    assert text_index.tolist() == [0] * len(TEXTS[3]) + [2] * len(TEXTS[0])
+    assert [len(batch) for batch in corpus.iter_batches(2)] == [2, 2, 1]
+
+
+@pytest.mark.parametrize(
+    "vectorizer_classes",
+    [
+        (CountVectorizer, TokenCorpusCountVectorizer),
+        (TfidfVectorizer, TokenCorpusTfidfVectorizer),
+    ],
+)
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"ngram_range": (1, 1)},
+        {"ngram_range": (1, 3), "stop_words": ["the", "in"]},
+        {"ngram_range": (2, 2), "min_df": 2, "binary": True},
+    ],
+)
+def test_token_corpus_vectorizer(vectorizer_classes, params):
+    vectorizer_class, corpus_vectorizer_class = vectorizer_classes
+    params = {
+        "lowercase": False,
+        "tokenizer": lambda x: x,
+        "preprocessor": lambda x: x,
+        "token_pattern": None,
+        **params,
+    }
+    corpus = TokenCorpus.from_texts(TEXTS)
+    train, test = np.array([0, 2, 3]), np.array([4, 1, 0])
+    vectorizer = vectorizer_class(**params)
+    corpus_vectorizer = corpus_vectorizer_class(**params)
+    train_matrix = vectorizer.fit_transform([TEXTS[i] for i in train])
+    corpus_train_matrix = corpus_vectorizer.fit_transform(corpus[train])
+    assert corpus_vectorizer.vocabulary_ == vectorizer.vocabulary_
+    assert np.allclose(corpus_train_matrix.toarray(), train_matrix.toarray())
+    test_matrix = vectorizer.transform([TEXTS[i] for i in test]).toarray()
+    assert np.allclose(corpus_vectorizer.transform(corpus[test]).toarray(), test_matrix)
+    # Another corpus, whose features are found from their names
+    other_corpus = TokenCorpus.from_texts([TEXTS[i] for i in test])
+    assert np.allclose(corpus_vectorizer.transform(other_corpus).toarray(), test_matrix)
+
+
+@pytest.mark.parametrize(
+    "texts, ngram_range",
+    [
+        # The keys of the 20-grams of the tokens do not fit in int64
+        (TEXTS, (1, 20)),
+        # The n-grams of "a b" + "c" and "a" + "b c" have the same name
+        ([["a b", "c"], ["a", "b c"], ["a", "b", "c"]], (1, 2)),
+    ],
+)
+def test_token_corpus_vectorizer_fallback(texts, ngram_range):
+    params = {
+        "lowercase": False,
+        "tokenizer": lambda x: x,
+        "preprocessor": lambda x: x,
+        "token_pattern": None,
+        "ngram_range": ngram_range,
+    }
+    vectorizer = CountVectorizer(**params)
+    corpus_vectorizer = TokenCorpusCountVectorizer(**params)
+    matrix = vectorizer.fit_transform(texts).toarray()
+    corpus = TokenCorpus.from_texts(texts)
+    assert np.array_equal(corpus_vectorizer.fit_transform(corpus).toarray(), matrix)
+    assert corpus_vectorizer.vocabulary_ == vectorizer.vocabulary_
+    assert np.array_equal(corpus_vectorizer.transform(corpus).toarray(), matrix)
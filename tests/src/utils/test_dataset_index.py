@@ -0,0 +1,63 @@
+import pytest
+from src.utils.dataset_index import (
+    build_jsonlines_index,
+    get_index_file_paths,
+    get_jsonlines_index,
+    sample_jsonlines,
+)
+from src.utils.json import read_jsonlines, write_jsonlines
+
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    write_jsonlines(
+        [
+            {"id": str(i), "text": f"Impression: {i} é", "label": i % 2}
+            for i in range(10)
+        ],
+        dataset_path,
+    )
+    return dataset_path
+
+
+def test_jsonlines_index(dataset_path):
+    dataset = read_jsonlines(dataset_path)
+    dataset_index = get_jsonlines_index(dataset_path)
+    assert all(path.exists() for path in get_index_file_paths(dataset_path))
+    assert len(dataset_index) == len(dataset)
+    assert dataset_index.read_records([3, 0, 9]) == [
+        dataset[3],
+        dataset[0],
+        dataset[9],
+    ]
+    assert dataset_index.read_records_by_id(["7"]) == [dataset[7]]
+    samples = dataset_index.sample_records(4)
+    assert len(samples) == 4 and all(sample in dataset for sample in samples)
+
+
+def test_jsonlines_index_is_rebuilt(dataset_path):
+    build_jsonlines_index(dataset_path)
+    write_jsonlines([{"id": "10", "text": "", "label": 0}], dataset_path, mode="a")
+    dataset_index = get_jsonlines_index(dataset_path)
+    assert len(dataset_index) == 11
+    assert dataset_index.read_records_by_id(["10"])[0]["id"] == "10"
+
+
+@pytest.mark.parametrize("file_name", ["dataset.jsonl.gz", "dataset-*.jsonl"])
+def test_sample_jsonlines_without_index(tmp_path, dataset_path, file_name):
+    dataset = read_jsonlines(dataset_path)
+    if "*" in file_name:
+        for shard_index in range(3):
+            write_jsonlines(
+                dataset[shard_index::3], tmp_path / f"dataset-{shard_index}.jsonl"
+            )
+        dataset = read_jsonlines(tmp_path / file_name)
+    else:
+        write_jsonlines(dataset, tmp_path / file_name)
+    samples = sample_jsonlines(tmp_path / file_name, 4, seed=0)
+    assert samples == sample_jsonlines(tmp_path / file_name, 4, seed=0)
+    positions = [dataset.index(sample) for sample in samples]
+    assert len(set(positions)) == 4 and positions == sorted(positions)
+    assert sample_jsonlines(tmp_path / file_name, 20) == dataset
+    assert not any(path.exists() for path in get_index_file_paths(tmp_path / file_name))
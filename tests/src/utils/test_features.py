@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from src.utils.features import (
+    get_feature_index_path,
+    get_feature_rows,
+    read_feature_store,
+    write_feature_store,
+)
+from src.utils.training import get_train_and_test_set
+
+
+@pytest.fixture
+def features_file_path(tmp_path):
+    return tmp_path / "features.npy"
+
+
+def test_feature_store(features_file_path):
+    ids = ["a", "b", "c"]
+    matrix = np.arange(6).reshape(3, 2)
+    write_feature_store(features_file_path, ids, matrix, feature_names=["x", "y"])
+    assert get_feature_index_path(features_file_path).exists()
+    feature_store = read_feature_store(features_file_path)
+    assert isinstance(feature_store.matrix, np.memmap)
+    assert feature_store.matrix.dtype == np.float32
+    assert feature_store.ids == ids
+    assert feature_store.feature_names == ["x", "y"]
+    rows = feature_store.get_rows(["c", "a", "d"])
+    assert rows.tolist() == [2, 0, -1]
+    features = get_feature_rows(feature_store, rows[:2])
+    assert features.tolist() == [[4, 5], [0, 1]]
+    features = get_feature_rows(feature_store, rows)
+    assert features[:2].tolist() == [[4, 5], [0, 1]]
+    assert np.isnan(features[2]).all()
+    assert get_feature_rows(feature_store, rows, fill_value=0)[2].tolist() == [0, 0]
+
+
+def test_train_and_test_set_with_missing_features(features_file_path):
+    write_feature_store(features_file_path, ["0", "1", "2", "3"], np.ones((4, 2)))
+    feature_store = read_feature_store(features_file_path)
+    dataset = [
+        {"id": str(i), "text": f"report {i}", "label": i % 2, "feature_row": i}
+        for i in range(4)
+    ]
+    dataset.append({"id": "4", "text": "report 4", "label": 0, "feature_row": -1})
+    train_set, test_set = get_train_and_test_set(
+        dataset, 0.8, feature_store=feature_store
+    )
+    features = np.concatenate([train_set["features"], test_set["features"]])
+    assert features.shape == (5, 2)
+    assert np.isnan(features).all(axis=1).sum() == 1
+
+
+def test_feature_store_checks(features_file_path):
+    with pytest.raises(AssertionError):
+        write_feature_store(features_file_path, ["a", "a"], np.zeros((2, 1)))
+    with pytest.raises(AssertionError):
+        write_feature_store(features_file_path, ["a"], np.zeros((2, 1)))
@@ -0,0 +1,12 @@
+import pytest
+from script.benchmark_import_time.benchmark_import_time import (
+    DEFAULT_MODULES,
+    get_import_time,
+)
+
+
+@pytest.mark.parametrize("module", DEFAULT_MODULES)
+def test_no_heavy_imports(module):
+    # The time itself depends on the machine, the heavy imports do not
+    _, heavy_modules = get_import_time(module)
+    assert heavy_modules == []
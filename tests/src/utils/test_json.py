@@ -0,0 +1,57 @@
+import pytest
+from src.utils.json import (
+    JsonlinesWriter,
+    get_shard_file_paths,
+    iter_jsonlines,
+    orjson,
+    read_jsonlines,
+    write_jsonlines,
+    zstandard,
+)
+
+BACKENDS = ["json"] + (["orjson"] if orjson is not None else [])
+
+
+@pytest.fixture
+def dataset():
+    return [
+        {"id": "1", "text": "Impression: normal étude", "label": 0},
+        {"id": "2", "text": "IMPRESSION: appendicitis", "label": 1, "features": []},
+        {"id": "3", "text": "", "label": 0},
+    ]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_write_and_read_jsonlines(tmp_path, dataset, backend):
+    file_path = tmp_path / "dataset.jsonl"
+    with JsonlinesWriter(file_path, buffer_size=2, backend=backend) as writer:
+        writer.write_all(dataset)
+    assert read_jsonlines(file_path, backend=backend) == dataset
+    write_jsonlines(dataset[:1], file_path, mode="a")
+    assert list(iter_jsonlines(file_path, backend=backend)) == dataset + dataset[:1]
+
+
+def test_iter_jsonlines_fields(tmp_path, dataset):
+    file_path = tmp_path / "dataset.jsonl"
+    write_jsonlines(dataset, file_path)
+    assert list(iter_jsonlines(file_path, fields=["id", "label"])) == [
+        {"id": elt["id"], "label": elt["label"]} for elt in dataset
+    ]
+
+
+@pytest.mark.parametrize(
+    "suffix", [".jsonl.gz"] + ([".jsonl.zst"] if zstandard else [])
+)
+def test_compressed_jsonlines_shards(tmp_path, dataset, suffix):
+    for shard_index in range(3):
+        write_jsonlines(dataset, tmp_path / f"dataset-{shard_index}{suffix}")
+    assert read_jsonlines(tmp_path / f"dataset-0{suffix}") == dataset
+    assert read_jsonlines(tmp_path / f"dataset-*{suffix}") == dataset * 3
+    assert list(iter_jsonlines(tmp_path / f"dataset-*{suffix}")) == dataset * 3
+
+
+def test_jsonlines_file_with_pattern_characters(tmp_path, dataset):
+    file_path = tmp_path / "reports[2023].jsonl"
+    write_jsonlines(dataset, file_path)
+    assert get_shard_file_paths(file_path) == [file_path]
+    assert read_jsonlines(file_path) == dataset
@@ -0,0 +1,226 @@
+import copy
+import re
+
+import pytest
+from src.utils.preprocessing import (
+    HEADERS,
+    PreprocessingPipeline,
+    fast_tokenize,
+    get_tokenizer,
+    lowercase_dataset,
+    remove_patterns_from_text,
+    select_report_sections,
+    split_measure_text,
+)
+
+
+@pytest.fixture
+def dataset():
+    return [
+        {
+            "text": "RENSEIGNEMENT CLINIQUE / CLINICAL INFORMATION: Pain. "
+            + "PROTOCOLE RADIOLOGIQUE / RADIOLOGIST'S REPORT: "
+            + "ULTRASOUND OF ABDOMEN AND PELVIS FINDINGS: Liver 14.2cm, "
+            + "appendix 1.1x2.2x3.3x4.4MM and 11.25mm, wall 3mm. "
+            + "IMPRESSION: Normal 10.1X4.5cm kidney. "
+        },
+        {"text": "Impressions: cm12.3mm x.5mm 2.2x3.3 exam\n"},
+        {"text": ""},
+    ]
+
+
+def preprocess_dataset_step_by_step(dataset, sections=None):
+    if sections is not None:
+        dataset = select_report_sections(dataset, sections)
+    dataset = remove_patterns_from_text(dataset, HEADERS)
+    dataset = lowercase_dataset(dataset)
+    return split_measure_text(dataset)
+
+
+@pytest.mark.parametrize("sections", [None, ["impression"]])
+def test_preprocessing_pipeline(dataset, sections):
+    expected_dataset = preprocess_dataset_step_by_step(copy.deepcopy(dataset), sections)
+    pipeline = PreprocessingPipeline(HEADERS, tokenizer_type=None, sections=sections)
+    assert pipeline.preprocess_dataset(dataset) == expected_dataset
+
+
+def test_preprocessing_pipeline_from_config():
+    pipeline = PreprocessingPipeline.from_config(
+        {
+            "patterns_to_remove": ["FINDINGS[:]?"],
+            "lowercase": False,
+            "split_measure_text": True,
+            "tokenizer_type": "nltk",
+        }
+    )
+    assert pipeline.patterns_to_remove == [re.compile("FINDINGS[:]?")]
+    assert pipeline.preprocess_text(" FINDINGS: 1.2x3.4CM 3mm") == "1.2 x 3.4CM 3 mm"
+
+
+def test_preprocessing_pipeline_n_jobs(dataset):
+    dataset = dataset * 5
+    pipeline = PreprocessingPipeline(HEADERS, tokenizer_type=None)
+    expected_dataset = pipeline.preprocess_dataset(copy.deepcopy(dataset))
+    assert pipeline.preprocess_dataset(dataset, n_jobs=2) == expected_dataset
+
+
+REPORT_SENTENCES = [
+    "Le foie mesure 14.2 cm. L'utérus est normal (voir rapport précédent).",
+    "The kidney measures 11.2 x 3.4 cm, non-specific findings; no hydronephrosis!",
+    "Appendix: 6 mm, can't exclude appendicitis. Patient's pain at 10:30.",
+    'Gallbladder "normal"... Réévaluer +/- CT in 2-3 weeks.',
+    "IMPRESSION: 1. Normal liver, e.g. no lesion. 2. Small kidney (3.5 cm).",
+    "Seen by Dr. Smith vs. the prior exam, i.e. stable; segment a. of the liver.",
+    "''Normal'' spleen, see ''prior'' report.",
+]
+
+
+def test_fast_tokenize():
+    assert fast_tokenize(REPORT_SENTENCES[0]) == [
+        "Le",
+        "foie",
+        "mesure",
+        "14.2",
+        "cm",
+        ".",
+        "L'utérus",
+        "est",
+        "normal",
+        "(",
+        "voir",
+        "rapport",
+        "précédent",
+        ")",
+        ".",
+    ]
+    assert fast_tokenize(REPORT_SENTENCES[2])[5:9] == [
+        "ca",
+        "n't",
+        "exclude",
+        "appendicitis",
+    ]
+    assert get_tokenizer("fast") is get_tokenizer("fast")
+
+
+def test_fast_tokenize_numbered_impression():
+    assert fast_tokenize("1. normal liver 2. small kidney 3. cyst 3.5. mm.") == [
+        "1.",
+        "normal",
+        "liver",
+        "2.",
+        "small",
+        "kidney",
+        "3.",
+        "cyst",
+        "3.5.",
+        "mm",
+        ".",
+    ]
+    assert fast_tokenize("''normal'' liver")[:3] == ["''", "normal", "''"]
+
+
+def test_fast_tokenize_matches_punkt_and_treebank(dataset):
+    """
+    word_tokenize without its downloaded punkt model: the sentences of a punkt
+    model which only knows the same abbreviations, then the treebank tokenizer.
+    """
+    from nltk.tokenize.destructive import NLTKWordTokenizer
+    from nltk.tokenize.punkt import PunktParameters, PunktSentenceTokenizer
+    from src.utils.preprocessing import ABBREVIATIONS
+
+    punkt_parameters = PunktParameters()
+    punkt_parameters.abbrev_types = set(ABBREVIATIONS)
+    sentence_tokenizer = PunktSentenceTokenizer(punkt_parameters)
+    word_tokenizer = NLTKWordTokenizer()
+    pipeline = PreprocessingPipeline(HEADERS, tokenizer_type=None)
+    texts = REPORT_SENTENCES + [pipeline(elt["text"]) for elt in dataset]
+    for text in texts + [text.lower() for text in texts]:
+        assert fast_tokenize(text) == [
+            token
+            for sentence in sentence_tokenizer.tokenize(text)
+            for token in word_tokenizer.tokenize(sentence)
+        ]
+
+
+# word_tokenize (with the english punkt model) tokens of each text, joined by
+# spaces, written down once so that fast_tokenize is checked without nltk data
+WORD_TOKENIZE_REFERENCE = [
+    (
+        "Le foie mesure 14.2 cm. L'utérus est normal (voir rapport précédent).",
+        "Le foie mesure 14.2 cm . L'utérus est normal ( voir rapport précédent ) .",
+    ),
+    (
+        "The kidney measures 11.2 x 3.4 cm, non-specific findings; no hydronephrosis!",
+        "The kidney measures 11.2 x 3.4 cm , non-specific findings ; no hydronephrosis !",
+    ),
+    (
+        "Appendix: 6 mm, can't exclude appendicitis. Patient's pain at 10:30.",
+        "Appendix : 6 mm , ca n't exclude appendicitis . Patient 's pain at 10:30 .",
+    ),
+    (
+        'Gallbladder "normal"... Réévaluer +/- CT in 2-3 weeks.',
+        "Gallbladder `` normal '' ... Réévaluer +/- CT in 2-3 weeks .",
+    ),
+    (
+        "IMPRESSION: 1. Normal liver, e.g. no lesion. 2. Small kidney (3.5 cm).",
+        "IMPRESSION : 1 . Normal liver , e.g. no lesion . 2 . Small kidney ( 3.5 cm ) .",
+    ),
+    (
+        "Seen by Dr. Smith, i.e. stable; segment a. of the liver.",
+        "Seen by Dr. Smith , i.e. stable ; segment a. of the liver .",
+    ),
+    (
+        "''Normal'' spleen, see ''prior'' report.",
+        "'' Normal '' spleen , see `` prior '' report .",
+    ),
+    (
+        "impression: 1. normal liver 2. small kidney 3. cyst 3.5. mm.",
+        "impression : 1. normal liver 2. small kidney 3. cyst 3.5. mm .",
+    ),
+    (
+        "No free fluid? The patient doesn't recall; won't return [see note].",
+        "No free fluid ? The patient does n't recall ; wo n't return [ see note ] .",
+    ),
+    (
+        'Mr. and Mrs. Tremblay asked: "is it benign?" Follow-up in 6 months.',
+        "Mr. and Mrs. Tremblay asked : `` is it benign ? '' Follow-up in 6 months .",
+    ),
+    (
+        "the liver is normal. the spleen is 12 cm.",
+        "the liver is normal . the spleen is 12 cm .",
+    ),
+]
+# Texts whose word_tokenize tokens are left out of the reference, see the
+# divergences in the docstring of fast_tokenize: (text, word_tokenize tokens,
+# fast_tokenize tokens)
+WORD_TOKENIZE_DIFFERENCES = [
+    (
+        "Gallstones, sludge etc. are absent.",
+        "Gallstones , sludge etc. are absent .",
+        "Gallstones , sludge etc . are absent .",
+    ),
+]
+
+
+def test_fast_tokenize_reference():
+    for text, tokens in WORD_TOKENIZE_REFERENCE:
+        assert fast_tokenize(text) == tokens.split(), text
+    for text, _, fast_tokens in WORD_TOKENIZE_DIFFERENCES:
+        assert fast_tokenize(text) == fast_tokens.split(), text
+
+
+def test_fast_tokenize_matches_word_tokenize(dataset):
+    from nltk.tokenize import word_tokenize
+
+    try:
+        word_tokenize("")
+    except LookupError:
+        pytest.skip("The nltk punkt models are not downloaded.")
+    for text, tokens in WORD_TOKENIZE_REFERENCE:
+        assert word_tokenize(text) == tokens.split(), text
+    for text, tokens, _ in WORD_TOKENIZE_DIFFERENCES:
+        assert word_tokenize(text) == tokens.split(), text
+    pipeline = PreprocessingPipeline(HEADERS, tokenizer_type=None)
+    texts = REPORT_SENTENCES + [pipeline(elt["text"]) for elt in dataset]
+    for text in texts + [text.lower() for text in texts]:
+        assert fast_tokenize(text) == word_tokenize(text)
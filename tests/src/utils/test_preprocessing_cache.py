@@ -0,0 +1,58 @@
+from src.utils.json import write_jsonlines
+from src.utils.preprocessing_cache import (
+    PreprocessingCache,
+    get_preprocessing_cache_key,
+)
+
+PREPROCESSING_CONFIG = {
+    "patterns_to_remove": ["FINDINGS[:]?"],
+    "lowercase": True,
+    "split_measure_text": True,
+    "tokenizer_type": "nltk",
+    "n_jobs": 1,
+}
+
+
+def get_preprocessed_dataset(n_records):
+    return [
+        {"id": str(i), "text": ["liver", "é", str(i)] * (i % 3), "label": i % 2}
+        for i in range(n_records)
+    ]
+
+
+def test_preprocessing_cache_key(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    write_jsonlines([{"id": "0", "text": "FINDINGS: liver", "label": 0}], dataset_path)
+    dataset_config = {"path": str(dataset_path), "n_samples": None}
+    key = get_preprocessing_cache_key(dataset_config, PREPROCESSING_CONFIG)
+    # The number of jobs does not change the preprocessed dataset
+    assert key == get_preprocessing_cache_key(
+        dataset_config, {**PREPROCESSING_CONFIG, "n_jobs": 4}
+    )
+    assert key != get_preprocessing_cache_key(
+        dataset_config, {**PREPROCESSING_CONFIG, "lowercase": False}
+    )
+    write_jsonlines([{"id": "1", "text": "", "label": 1}], dataset_path, mode="a")
+    assert key != get_preprocessing_cache_key(dataset_config, PREPROCESSING_CONFIG)
+
+
+def test_preprocessing_cache(tmp_path):
+    cache = PreprocessingCache(tmp_path, max_size_bytes=1 << 20)
+    dataset = get_preprocessed_dataset(10)
+    assert cache.get("a") is None
+    cache.put("a", dataset)
+    records, corpus = cache.get("a")
+    assert records == [{"id": elt["id"], "label": elt["label"]} for elt in dataset]
+    assert list(corpus) == [elt["text"] for elt in dataset]
+
+
+def test_preprocessing_cache_eviction(tmp_path):
+    cache = PreprocessingCache(tmp_path, max_size_bytes=1 << 20)
+    for key in ["a", "b", "c"]:
+        cache.put(key, get_preprocessed_dataset(100))
+    entry_size = sum(size for _, size in cache.get_entries()) // 3
+    # "a" is used again so that "b" is now the least recently used entry
+    cache.get("a")
+    cache.max_size_bytes = 2 * entry_size
+    assert cache.evict() == ["b"]
+    assert cache.get("b") is None and cache.get("a") is not None
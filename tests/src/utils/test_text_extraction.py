@@ -1,8 +1,18 @@
 import pytest
 import re
 from src.utils.text_extraction import (
+    PREAMBLE_SECTION,
+    LineFilter,
+    MarkerMatcher,
+    ReportSegmenter,
     delete_text_between_markers,
     extract_text_between_markers,
+    iter_delete_text_between_markers,
+    iter_extract_text_between_markers,
+    iter_remove_whitespace_lines,
+    iter_strip_text_lines,
+    iter_texts_between_markers,
+    marker_is_in_text,
     remove_lines_containing_pattern,
     remove_whitespace_lines,
     strip_text_lines,
@@ -210,3 +220,175 @@ def test_remove_lines_containing_pattern(
     print(len(filtered_text))
     print(len(text_as_list))
     assert filtered_text == expected_remove_lines_containing_pattern
+
+
+def test_marker_matcher(text_as_list, start_marker, end_marker):
+    # µ (micro sign) and μ (mu) are the same letter for re.IGNORECASE only
+    text_as_list = text_as_list + ["Kyste de 3 μm", "KYSTE DE 3 µM"]
+    for markers in [
+        start_marker,
+        end_marker,
+        [],
+        [""],
+        ["hôpital", "PAGE 2"],
+        ["µm", "ÉCHOGRAPHIE"],
+    ]:
+        marker_matcher = MarkerMatcher(markers)
+        case_sensitive_marker_matcher = MarkerMatcher(markers, case_insensitive=False)
+        for line in text_as_list:
+            assert marker_matcher.is_in(line) == marker_is_in_text(markers, line)
+            assert case_sensitive_marker_matcher.is_in(line) == marker_is_in_text(
+                markers, line, case_insensitive=False
+            )
+
+
+def test_extract_text_between_markers_with_marker_matchers(
+    text_as_list, start_marker, end_marker, expected_extract_text_between_markers
+):
+    extracted_text = extract_text_between_markers(
+        MarkerMatcher(start_marker), MarkerMatcher(end_marker), text_as_list
+    )
+    assert extracted_text == expected_extract_text_between_markers
+
+
+def test_delete_text_between_markers_with_marker_matchers(
+    text_as_list,
+    start_between_markers,
+    end_between_markers,
+    expected_delete_text_between_markers,
+):
+    extracted_text = delete_text_between_markers(
+        [MarkerMatcher(marker) for marker in start_between_markers],
+        [MarkerMatcher(marker) for marker in end_between_markers],
+        text_as_list,
+    )
+    assert extracted_text == expected_delete_text_between_markers
+
+
+def test_line_filter(
+    text_as_list, patterns_to_remove, expected_remove_lines_containing_pattern
+):
+    line_filter = LineFilter(patterns_to_remove)
+    assert line_filter.filter_lines(text_as_list) == (
+        expected_remove_lines_containing_pattern
+    )
+    assert (
+        remove_lines_containing_pattern(line_filter, text_as_list)
+        == expected_remove_lines_containing_pattern
+    )
+    assert line_filter.filter_text("".join(text_as_list)) == "".join(
+        expected_remove_lines_containing_pattern
+    )
+    assert (
+        list(line_filter.filter_documents([text_as_list, text_as_list]))
+        == [expected_remove_lines_containing_pattern] * 2
+    )
+
+
+def test_line_filter_uncombinable_patterns():
+    # Backreference, global inline flag and str.lower semantics (final sigma)
+    patterns = [re.compile(r"(\d)\1"), re.compile(r"(?i)page"), "ς"]
+    text_as_list = ["11 a\n", "12 PAGE\n", "ΣΑ\n", "οδος\n", "12 b\n"]
+    expected_text = ["ΣΑ\n", "12 b\n"]
+    assert remove_lines_containing_pattern(patterns, text_as_list) == expected_text
+    line_filter = LineFilter(patterns)
+    assert line_filter.filter_lines(text_as_list) == expected_text
+    assert len(line_filter.separate_regexes) == 2
+
+
+def test_iter_extract_text_between_markers(
+    text_as_list, start_marker, end_marker, expected_extract_text_between_markers
+):
+    lines = iter(text_as_list)
+    extracted_text = list(
+        iter_extract_text_between_markers(start_marker, end_marker, lines)
+    )
+    assert extracted_text == expected_extract_text_between_markers
+    # Reading stops at the end marker
+    assert next(lines) == "Radiologiste/Reporting MD:\n"
+    # Without a start marker, the text is taken from the first line
+    assert list(
+        iter_extract_text_between_markers("Not a marker", end_marker, text_as_list)
+    ) == extract_text_between_markers("Not a marker", end_marker, text_as_list)
+
+
+def test_iter_texts_between_markers(
+    text_as_list, start_marker, end_marker, expected_extract_text_between_markers
+):
+    texts = list(iter_texts_between_markers(start_marker, end_marker, text_as_list * 3))
+    assert texts == [expected_extract_text_between_markers] * 3
+
+
+def test_iter_delete_text_between_markers(
+    text_as_list,
+    start_between_markers,
+    end_between_markers,
+    expected_delete_text_between_markers,
+):
+    extracted_text = iter_delete_text_between_markers(
+        start_between_markers, end_between_markers, text_as_list
+    )
+    assert list(extracted_text) == expected_delete_text_between_markers
+
+
+def test_iter_strip_lines_and_whitepsace(text_as_list, expected_stripped_text):
+    stripped_text = iter_strip_text_lines(text_as_list)
+    stripped_text = iter_remove_whitespace_lines(stripped_text)
+    assert list(stripped_text) == expected_stripped_text
+
+
+def test_report_segmenter(
+    text_as_list,
+    start_marker,
+    end_marker,
+    start_between_markers,
+    end_between_markers,
+):
+    text = "".join(text_as_list)
+    segmenter = ReportSegmenter(
+        body_begin_markers=start_marker,
+        body_end_markers=end_marker,
+        body_between_start_markers=start_between_markers,
+        body_between_end_markers=end_between_markers,
+    )
+    report = segmenter.segment(text)
+    assert [section.name for section in report.sections] == [
+        "clinical_information",
+        "radiologist_report",
+        "examination",
+        "impression",
+    ]
+    assert report.get_section_text("clinical_information") == "\nXXX.\n"
+    assert report.get_section_text("radiologist_report") == "\n"
+    assert report.get_section_text("examination") == "\nXXX.\n"
+    # The lines between markers are skipped in the middle of the section
+    assert report.get_section_text("impression") == "\nXXX.\nXXX\n \n \n"
+    impression = report.get_sections("impression")[0]
+    assert len(impression.spans) == 2
+    assert text[impression.header_start : impression.start] == "IMPRESSION:"
+    # The sections are the same text as the three passes, without the headers
+    body = delete_text_between_markers(
+        start_between_markers,
+        end_between_markers,
+        extract_text_between_markers(start_marker, end_marker, text_as_list),
+    )
+    expected_text = "".join(body)
+    assert "".join(
+        report.get_section_text(name) for name in segmenter.section_names
+    ) == segmenter.header_regex.sub("", expected_text)
+
+
+def test_report_segmenter_without_markers():
+    text = "Preamble\nFINDINGS: a\nb\nImpression: c"
+    report = ReportSegmenter().segment(text)
+    assert [section.name for section in report.sections] == [
+        PREAMBLE_SECTION,
+        "findings",
+        "impression",
+    ]
+    assert report.get_section_text(PREAMBLE_SECTION) == "Preamble\n"
+    assert report.get_section_text("findings") == " a\nb\n"
+    findings = report.get_sections("findings")[0]
+    assert text[findings.start : findings.end] == " a\nb\n"
+    assert report.get_section_text("impression") == " c"
+    assert ReportSegmenter().segment("").sections == []
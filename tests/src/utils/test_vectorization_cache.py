@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from src.utils.corpus import TokenCorpus
+from src.utils.training import (
+    VECTORIZER_DTYPES,
+    create_vectorizer,
+    set_vectorizer_vocabulary,
+)
+from src.utils.vectorization_cache import (
+    DocumentTermMatrices,
+    VectorizationCache,
+    get_vectorization_cache_key,
+)
+
+TEXTS = [
+    ["the", "liver", "is", "normal", "."],
+    ["no", "focal", "lesion", "in", "the", "liver", "."],
+    ["the", "spleen", "is", "normal", "in", "size", "."],
+    ["the", "liver", "is", "enlarged", "."],
+]
+SPLIT_CONFIG = {"train_test_ratio_split": 0.8, "seed": 42}
+VECTORIZER_CONFIG = {
+    "vectorizer_type": "count",
+    "remove_stopwords": False,
+    "ngram_range": [1, 2],
+    "binary": False,
+}
+
+
+def test_vectorization_cache_key():
+    key = get_vectorization_cache_key("a", SPLIT_CONFIG, VECTORIZER_CONFIG)
+    assert key == get_vectorization_cache_key("a", SPLIT_CONFIG, VECTORIZER_CONFIG)
+    assert key != get_vectorization_cache_key("b", SPLIT_CONFIG, VECTORIZER_CONFIG)
+    assert key != get_vectorization_cache_key(
+        "a", SPLIT_CONFIG, {**VECTORIZER_CONFIG, "binary": True}
+    )
+
+
+@pytest.mark.parametrize("vectorizer_type", ["count", "tfidf"])
+def test_vectorization_cache(tmp_path, vectorizer_type):
+    corpus = TokenCorpus.from_texts(TEXTS)
+    train_texts, test_texts = corpus[:3], corpus[3:]
+    vectorizer = create_vectorizer(
+        vectorizer_type,
+        remove_stopwords=False,
+        ngram_range=(1, 2),
+        dtype=VECTORIZER_DTYPES[vectorizer_type],
+    )
+    matrices = DocumentTermMatrices(
+        feature_names=vectorizer.fit(train_texts).get_feature_names_out().tolist(),
+        idf=getattr(vectorizer, "idf_", None),
+        train_matrix=vectorizer.transform(train_texts),
+        test_matrix=vectorizer.transform(test_texts),
+    )
+    cache = VectorizationCache(tmp_path, max_size_bytes=1 << 20)
+    assert cache.get("a") is None
+    cache.put("a", matrices)
+    cached_matrices = cache.get("a")
+    assert cached_matrices.feature_names == matrices.feature_names
+    assert cached_matrices.train_matrix.dtype == VECTORIZER_DTYPES[vectorizer_type]
+    assert (cached_matrices.test_matrix != matrices.test_matrix).nnz == 0
+    # A vectorizer made from the cached vocabulary transforms as the fitted one
+    cached_vectorizer = create_vectorizer(
+        vectorizer_type,
+        remove_stopwords=False,
+        ngram_range=(1, 2),
+        dtype=VECTORIZER_DTYPES[vectorizer_type],
+    )
+    set_vectorizer_vocabulary(
+        cached_vectorizer, cached_matrices.feature_names, cached_matrices.idf
+    )
+    assert np.array_equal(
+        cached_vectorizer.transform(test_texts).toarray(),
+        matrices.test_matrix.toarray(),
+    )